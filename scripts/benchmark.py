@@ -0,0 +1,601 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the hot paths in the import commands and helpers.
+These don't need a database.
+
+Usage:
+    python scripts/benchmark.py [benchmark ...]
+"""
+
+import csv
+import os
+import random
+import re
+import string
+import sys
+import tempfile
+import time
+
+import django
+from django.conf import settings
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+
+def root(*x):
+    return os.path.join(BASE_DIR, *x)
+
+
+if not settings.configured:
+    settings.configure(DEBUG=True)
+
+django.setup()
+
+from uk_geo_utils.helpers import (  # noqa: E402
+    Postcode,
+    format_local_auth_label,
+    format_paf_label,
+    normalise_postcodes,
+)
+from uk_geo_utils.management.commands import (  # noqa: E402
+    clean_addressbase_plus,
+)
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def time_per_item(func, items, repeat=3):
+    """Best of `repeat` runs of func(items), in microseconds per item"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(items)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(items) * 1_000_000
+
+
+def report(name, before, after):
+    print(
+        f"{name}: {before:.2f}us -> {after:.2f}us per item "
+        f"({before / after:.1f}x faster)"
+    )
+
+
+class LegacyPAFAddressFormatter:
+    # helpers.PAFAddressFormatter as it was before format_paf_label()
+    def __init__(
+        self,
+        organisation_name,
+        department_name,
+        po_box_number,
+        sub_building_name,
+        building_name,
+        building_number,
+        dependent_thoroughfare,
+        thoroughfare,
+        post_town,
+        double_dependent_locality,
+        dependent_locality,
+    ):
+        """one to one mapping."""
+        self.organisation_name = organisation_name
+        self.department_name = department_name
+        self.po_box_number = po_box_number
+        self.sub_building_name = sub_building_name
+        self.building_name = building_name
+        self.building_number = building_number
+        self.dependent_thoroughfare = dependent_thoroughfare
+        self.thoroughfare = thoroughfare
+        self.post_town = post_town
+        self.double_dependent_locality = double_dependent_locality
+        self.dependent_locality = dependent_locality
+        self.address_label = []
+
+    def generate_address_label(self):
+        """Construct a list for address label.
+
+        Non-empty premises elements are appended to the address label in the
+        order of organisation_name, department_name, po_box_number (which
+        must be prepended with 'PO Box', sub_building_name, building_name,
+        building_number, then the rest of the elements except for Town and
+        Postcode because we want them in their own fields. This isn't strict
+        address label but we're probably loading them into a database.
+        """
+        if self.organisation_name:
+            self.address_label.append(self.organisation_name)
+        if self.department_name:
+            self.address_label.append(self.department_name)
+        if self.po_box_number:
+            self.address_label.append("PO Box " + self.po_box_number)
+
+        elements = [
+            self.sub_building_name,
+            self.building_name,
+            self.building_number,
+            self.dependent_thoroughfare,
+            self.thoroughfare,
+            self.double_dependent_locality,
+            self.dependent_locality,
+        ]
+
+        for element in elements:
+            if element:
+                self._append_to_label(element)
+
+        # pad label to length of 7 if not already
+        if len(self.address_label) < 7:
+            for i in range(7 - len(self.address_label)):
+                self.address_label.append("")
+
+        # finally, add post town
+        self.address_label[5] = self.post_town
+
+        return ", ".join([f for f in self.address_label if f])
+
+    def _is_exception_rule(self, element):
+        """Check for "exception rule".
+
+        Address elements will be appended onto a new line on the label except
+        for when the penultimate lable line fulfils certain criteria, in which
+        case the element will be concatenated onto the penultimate line. This
+        method checks for those criteria.
+
+        i) First and last characters of the Building Name are numeric
+          (eg '1to1' or '100:1')
+        ii) First and penultimate characters are numeric, last character is
+          alphabetic (eg '12A')
+        iii) Building Name has only one character (eg 'A')
+        """
+        if element[0].isdigit() and element[-1].isdigit():
+            return True
+        if (
+            len(element) > 1
+            and element[0].isdigit()
+            and element[-2].isdigit()
+            and element[-1].isalpha()
+        ):
+            return True
+        return bool(len(element) == 1 and element.isalpha())
+
+    def _append_to_label(self, element):
+        """Append address element to the label.
+
+        Normally an element will be appended onto the list, except where the
+        existing last element fulfils the exception rule, in which case the
+        element will be concatenated onto the final list member.
+        """
+        if len(self.address_label) > 0 and self._is_exception_rule(
+            self.address_label[-1]
+        ):
+            self.address_label[-1] += " " + element
+        else:
+            self.address_label.append(element)
+
+    def __str__(self):
+        """Return the label form of the address."""
+        return ",".join(self.generate_address_label())
+
+
+class LegacyLocalAuthAddressFormatter:
+    # helpers.LocalAuthAddressFormatter as it was before
+    # format_local_auth_label()
+    def __init__(
+        self,
+        organisation_name,
+        sao_start_number,
+        sao_start_suffix,
+        sao_end_number,
+        sao_end_suffix,
+        sao_text,
+        pao_start_number,
+        pao_start_suffix,
+        pao_end_number,
+        pao_end_suffix,
+        pao_text,
+        street_description,
+        locality,
+        town_name,
+    ):
+        self.organisation_name = organisation_name
+        self.sao_start_number = sao_start_number
+        self.sao_start_suffix = sao_start_suffix
+        self.sao_end_number = sao_end_number
+        self.sao_end_suffix = sao_end_suffix
+        self.sao_text = sao_text
+        self.pao_start_number = pao_start_number
+        self.pao_start_suffix = pao_start_suffix
+        self.pao_end_number = pao_end_number
+        self.pao_end_suffix = pao_end_suffix
+        self.pao_text = pao_text
+        self.street_description = street_description
+        self.locality = locality
+        self.town_name = town_name
+
+    @property
+    def primary_addressable_object(self):
+        return self._get_addressable_object(
+            self.pao_text,
+            self.pao_start_number,
+            self.pao_start_suffix,
+            self.pao_end_number,
+            self.pao_end_suffix,
+        )
+
+    @property
+    def secondary_addressable_object(self):
+        return self._get_addressable_object(
+            self.sao_text,
+            self.sao_start_number,
+            self.sao_start_suffix,
+            self.sao_end_number,
+            self.sao_end_suffix,
+        )
+
+    def _get_addressable_object(
+        self, text, start_number, start_suffix, end_number, end_suffix
+    ):
+        # based on SQL from
+        # https://www.ordnancesurvey.co.uk/documents/addressbase-products-getting-started-guide1.pdf
+        # page 57-59
+        ao = ""
+        if text:
+            ao = ao + text + " "
+
+        if start_number and not start_suffix and not end_number:
+            ao = ao + start_number + " "
+        else:
+            ao = ao + start_number
+
+        if start_suffix and not end_number:
+            ao = ao + start_suffix + " "
+        elif start_suffix and end_number:
+            ao = ao + start_suffix
+
+        if (end_suffix and end_number) or (start_number and end_number):
+            ao = ao + "-"
+
+        if end_number and not end_suffix:
+            ao = ao + end_number + " "
+        elif not end_number:
+            ao = ao + ""
+        else:
+            ao = ao + end_number
+
+        if end_suffix:
+            ao = ao + end_suffix + " "
+
+        return ao
+
+    def generate_address_label(self):
+        add_line2 = (
+            self.secondary_addressable_object
+            + self.primary_addressable_object
+            + self.street_description
+        )
+        address_label = [
+            self.organisation_name,
+            add_line2,
+            self.locality,
+            self.town_name,
+        ]
+        return ", ".join([f for f in address_label if f])
+
+
+def legacy_clean_plus(csv_path):
+    # clean_addressbase_plus as it was when it used csv.DictReader
+    address_fields_d = [
+        "DEPARTMENT_NAME",
+        "PO_BOX_NUMBER",
+        "SUB_BUILDING_NAME",
+        "BUILDING_NAME",
+        "BUILDING_NUMBER",
+        "DEPENDENT_THOROUGHFARE",
+        "THOROUGHFARE",
+        "DOUBLE_DEPENDENT_LOCALITY",
+        "DEPENDENT_LOCALITY",
+        "POST_TOWN",
+    ]
+    address_fields_l = [
+        "SAO_START_NUMBER",
+        "SAO_START_SUFFIX",
+        "SAO_END_NUMBER",
+        "SAO_END_SUFFIX",
+        "SAO_TEXT",
+        "PAO_START_NUMBER",
+        "PAO_START_SUFFIX",
+        "PAO_END_NUMBER",
+        "PAO_END_SUFFIX",
+        "PAO_TEXT",
+        "STREET_DESCRIPTION",
+        "LOCALITY",
+        "TOWN_NAME",
+    ]
+    with open(csv_path) as csv_file:
+        for line in csv.DictReader(
+            csv_file, fieldnames=clean_addressbase_plus.FIELDNAMES
+        ):
+            if line["ADDRESSBASE_POSTAL"] == "N" or line["COUNTRY"] not in [
+                "E",
+                "W",
+                "S",
+                "N",
+            ]:
+                continue
+            if line["ADDRESSBASE_POSTAL"] == "D":
+                kwargs = {
+                    k.lower(): line[k] for k in line if k in address_fields_d
+                }
+                kwargs["organisation_name"] = line["RM_ORGANISATION_NAME"]
+                address = LegacyPAFAddressFormatter(
+                    **kwargs
+                ).generate_address_label()
+            else:
+                kwargs = {
+                    k.lower(): line[k] for k in line if k in address_fields_l
+                }
+                kwargs["organisation_name"] = line["LA_ORGANISATION"]
+                address = LegacyLocalAuthAddressFormatter(
+                    **kwargs
+                ).generate_address_label()
+            data = {}
+            data["UPRN"] = line["UPRN"]
+            data["address"] = address
+            if line["ADDRESSBASE_POSTAL"] == "D":
+                data["postcode"] = line["POSTCODE"]
+            else:
+                data["postcode"] = line["POSTCODE_LOCATOR"]
+            data["location"] = "SRID=4326;POINT({} {})".format(
+                line["LONGITUDE"], line["LATITUDE"]
+            )
+            data["addressbase_postal"] = line["ADDRESSBASE_POSTAL"]
+            yield data
+
+
+@benchmark
+def clean_addressbase_plus_rows(n=200_000):
+    """Per-row cost of parsing and cleaning AddressBase Plus CSV rows"""
+    fixtures = root("uk_geo_utils", "fixtures", "addressbase_plus")
+    sample = []
+    for name in ["addressbase_test1.csv", "addressbase_test2.csv"]:
+        with open(os.path.join(fixtures, name)) as f:
+            sample.extend(line.rstrip("\n") + "\n" for line in f)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        csv_path = os.path.join(tmpdir, "addressbase.csv")
+        with open(csv_path, "w") as f:
+            for i in range(n):
+                f.write(sample[i % len(sample)])
+
+        cmd = clean_addressbase_plus.Command()
+
+        def before(rows):
+            for _ in legacy_clean_plus(csv_path):
+                pass
+
+        def after(rows):
+            for line in cmd.line_filter(csv_path):
+                cmd.clean_output_line(line)
+
+        rows = range(n)
+        report(
+            "clean_addressbase_plus rows",
+            time_per_item(before, rows),
+            time_per_item(after, rows),
+        )
+
+
+# Values to pick PAF fields from, including the building names which
+# trigger the "exception rule"
+PAF_SAMPLE = {
+    "organisation_name": ["", "", "", "ACME LTD", "1"],
+    "department_name": ["", "", "", "", "SALES"],
+    "po_box_number": ["", "", "", "", "123"],
+    "sub_building_name": ["", "", "", "FLAT 1", "2B", "A"],
+    "building_name": ["", "", "ROSE COTTAGE", "1-7", "12A", "B", "100:1"],
+    "building_number": ["", "33", "7", "144"],
+    "dependent_thoroughfare": ["", "", "", "MILL LANE"],
+    "thoroughfare": ["", "BONEHURST ROAD", "HIGH STREET"],
+    "post_town": ["HORLEY", "REDHILL", ""],
+    "double_dependent_locality": ["", "", "", "", "LITTLE HAMLET"],
+    "dependent_locality": ["", "", "", "MILE OAK"],
+}
+
+
+@benchmark
+def paf_label(n=1_000_000):
+    """Formatting PAF address labels"""
+    random.seed(0)
+    rows = [
+        tuple(random.choice(values) for values in PAF_SAMPLE.values())
+        for _ in range(n)
+    ]
+
+    for row in rows:
+        expected = LegacyPAFAddressFormatter(*row).generate_address_label()
+        if format_paf_label(row) != expected:
+            raise AssertionError(f"format_paf_label{row} != {expected!r}")
+
+    def before(items):
+        for item in items:
+            LegacyPAFAddressFormatter(*item).generate_address_label()
+
+    def after(items):
+        for item in items:
+            format_paf_label(item)
+
+    report(
+        "format_paf_label",
+        time_per_item(before, rows),
+        time_per_item(after, rows),
+    )
+
+
+# Values to pick local authority address fields from
+LOCAL_AUTH_SAMPLE = {
+    "organisation_name": ["", "", "", "ACME LTD"],
+    "sao_start_number": ["", "", "", "1", "12"],
+    "sao_start_suffix": ["", "", "", "", "A"],
+    "sao_end_number": ["", "", "", "", "3"],
+    "sao_end_suffix": ["", "", "", "", "", "B"],
+    "sao_text": ["", "", "", "FLAT", "UNIT 4"],
+    "pao_start_number": ["", "1", "7", "33", "144"],
+    "pao_start_suffix": ["", "", "", "", "A"],
+    "pao_end_number": ["", "", "", "", "9"],
+    "pao_end_suffix": ["", "", "", "", "", "C"],
+    "pao_text": ["", "", "", "ROSE COTTAGE"],
+    "street_description": ["HIGH STREET", "BONEHURST ROAD", "MILL LANE"],
+    "locality": ["", "", "MILE OAK"],
+    "town_name": ["HORLEY", "REDHILL", ""],
+}
+
+
+@benchmark
+def local_auth_label(n=1_000_000):
+    """Formatting local authority address labels"""
+    random.seed(0)
+    rows = [
+        tuple(random.choice(values) for values in LOCAL_AUTH_SAMPLE.values())
+        for _ in range(n)
+    ]
+
+    for row in rows:
+        expected = LegacyLocalAuthAddressFormatter(
+            *row
+        ).generate_address_label()
+        if format_local_auth_label(row) != expected:
+            raise AssertionError(
+                f"format_local_auth_label{row} != {expected!r}"
+            )
+
+    def before(items):
+        for item in items:
+            LegacyLocalAuthAddressFormatter(*item).generate_address_label()
+
+    def after(items):
+        for item in items:
+            format_local_auth_label(item)
+
+    report(
+        "format_local_auth_label",
+        time_per_item(before, rows),
+        time_per_item(after, rows),
+    )
+
+
+class LegacyPostcode:
+    # helpers.Postcode as it was before it was optimised
+    def __init__(self, postcode, validate=False):
+        self.postcode = re.sub("[^A-Z0-9]", "", str(postcode).upper())
+        if validate and len(str(self.postcode)) < 5:
+            raise ValueError("Postcode must have at least 5 characters")
+
+    @property
+    def territory(self):
+        if self.postcode[:2] == "BT":
+            return "NI"
+        return "GB"
+
+    @property
+    def with_space(self):
+        return self.postcode[:-3] + " " + self.postcode[-3:]
+
+    @property
+    def without_space(self):
+        return self.postcode
+
+
+POSTCODE_SAMPLE = [
+    "SW1A 1AA",
+    "sw1a1aa",
+    "M1 1AE",
+    "ec1a 1bb",
+    " BT1 5GS ",
+    "CR2 6XH",
+    "dn55 1pt",
+    "W1A 0AX",
+]
+
+
+def random_postcodes(n):
+    """n distinct, randomly formatted postcodes, which never hit a cache"""
+    postcodes = set()
+    while len(postcodes) < n:
+        outcode = "".join(
+            random.choices(string.ascii_uppercase, k=random.randint(1, 2))
+        ) + str(random.randint(1, 99))
+        incode = str(random.randint(0, 9)) + "".join(
+            random.choices(string.ascii_uppercase, k=2)
+        )
+        postcode = f"{outcode} {incode}"
+        postcodes.add(postcode.lower() if random.random() < 0.5 else postcode)
+    return list(postcodes)
+
+
+@benchmark
+def postcode(n=100_000):
+    """Constructing Postcodes and reading the formats geocoders use"""
+    random.seed(0)
+    samples = {
+        # the same few postcodes over and over, e.g. a busy web app
+        "repeated": [random.choice(POSTCODE_SAMPLE) for _ in range(n)],
+        # e.g. importing a CSV of addresses
+        "distinct": random_postcodes(n),
+    }
+
+    def use(cls):
+        def run(items):
+            for item in items:
+                p = cls(item)
+                p.territory
+                p.with_space
+                p.without_space
+                p.with_space
+
+        return run
+
+    def legacy_normalise(items):
+        for item in items:
+            LegacyPostcode(item).without_space
+
+    def normalise(items):
+        for item in items:
+            Postcode.normalise(item)
+
+    def legacy_bulk(items):
+        for item in items:
+            p = LegacyPostcode(item)
+            (p.with_space, p.without_space, p.territory)
+
+    def bulk(items):
+        for _ in normalise_postcodes(items):
+            pass
+
+    for label, postcodes in samples.items():
+        report(
+            f"Postcode ({label})",
+            time_per_item(use(LegacyPostcode), postcodes),
+            time_per_item(use(Postcode), postcodes),
+        )
+        report(
+            f"Postcode.normalise ({label})",
+            time_per_item(legacy_normalise, postcodes),
+            time_per_item(normalise, postcodes),
+        )
+        report(
+            f"normalise_postcodes ({label})",
+            time_per_item(legacy_bulk, postcodes),
+            time_per_item(bulk, postcodes),
+        )
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
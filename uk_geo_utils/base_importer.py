@@ -1,14 +1,28 @@
 import abc
+import csv
+import fnmatch
+import glob
+import hashlib
+import io
+import itertools
+import json
+import os
+import posixpath
 import shutil
 import tempfile
+import time
 import urllib.request
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import psutil
 from django.core.management.base import BaseCommand
 from django.db import DEFAULT_DB_ALIAS, connections, transaction
 
+from uk_geo_utils.helpers import clear_table_populated_cache
+from uk_geo_utils.models import ImportCheckpoint
+
 
 def unzip(filepath):
     zip_file = zipfile.ZipFile(filepath, "r")
@@ -17,6 +31,47 @@ def unzip(filepath):
     return tmpdir
 
 
+class CSVStream(io.TextIOBase):
+    """
+    Read-only file-like object which serialises rows from an iterable
+    as CSV when it is read. This allows rows from a generator to be passed
+    straight to cursor.copy_expert() without writing them to disk first.
+    """
+
+    def __init__(self, rows, chunk_size=1000):
+        self._rows = iter(rows)
+        self._chunk_size = chunk_size
+        self._buffer = ""
+        self._out = io.StringIO()
+        self._writer = csv.writer(self._out)
+
+    def readable(self):
+        return True
+
+    def _read_chunk(self):
+        self._writer.writerows(itertools.islice(self._rows, self._chunk_size))
+        chunk = self._out.getvalue()
+        self._out.seek(0)
+        self._out.truncate()
+        return chunk
+
+    def read(self, size=-1):
+        while size is None or size < 0 or len(self._buffer) < size:
+            chunk = self._read_chunk()
+            if not chunk:
+                break
+            self._buffer += chunk
+
+        if size is None or size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+CHECKPOINT_TABLE = ImportCheckpoint._meta.db_table
+
+
 def check_memory(required_memory: int = 2):
     # Downloading, unzipping and working with the ONSPD
     # requires a decent chunk of memory to play with.
@@ -37,15 +92,93 @@ class BaseImporter(BaseCommand):
         self.primary_key_constraint = None
         self.tempdir = None
         self.data_path = None
+        self.archive = None
+        self.archive_file = None
+        self.archive_listing = None
         self.cursor = None
+        self.database = DEFAULT_DB_ALIAS
+        self.resume = False
+        self.completed_phases = set()
+        self.source = None
+        self.parallel = 1
+        self.index_workers = 1
+        self.session_settings = {}
+        self.unlogged_load = False
+        self.allow_logical_slots = False
         self.table_name = self.get_table_name()
         self.temp_table_name = self.table_name + "_temp"
 
     def add_arguments(self, parser):
         group = parser.add_mutually_exclusive_group(required=True)
+        self.add_source_arguments(group)
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help=(
+                "Record each completed phase of the import and keep the temp "
+                "table if the import fails, so that running it again with "
+                "--resume carries on from the last completed phase"
+            ),
+        )
+        parser.add_argument(
+            "--unlogged-load",
+            action="store_true",
+            help=(
+                "Load data into an UNLOGGED temp table and make it LOGGED "
+                "just before it replaces the original table. Refuses to run "
+                "if the database has logical replication slots"
+            ),
+        )
+        parser.add_argument(
+            "--allow-logical-slots",
+            action="store_true",
+            help=(
+                "Use --unlogged-load even though the database has logical "
+                "replication slots. Logical replication will not see the "
+                "imported data"
+            ),
+        )
+        parser.add_argument(
+            "--index-workers",
+            type=int,
+            default=1,
+            help=(
+                "Number of database connections to build the temp table's "
+                "indexes with concurrently"
+            ),
+        )
+        parser.add_argument(
+            "--maintenance-work-mem",
+            help="Value of maintenance_work_mem to build indexes with, e.g. 1GB",
+        )
+        parser.add_argument(
+            "--max-parallel-maintenance-workers",
+            type=int,
+            help="Value of max_parallel_maintenance_workers to build indexes with",
+        )
+
+    def add_source_arguments(self, group):
+        # exactly one of these is required
         group.add_argument("--url", action="store")
         group.add_argument("--data-path", action="store")
-        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def add_data_file_arguments(self, parser):
+        # for importers which COPY a directory of CSV files
+        parser.add_argument(
+            "--parallel",
+            type=int,
+            default=1,
+            help="Number of database connections to COPY files with concurrently",
+        )
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            help=(
+                "With --url, read the CSVs straight from the downloaded zip "
+                "instead of extracting them to disk first"
+            ),
+        )
 
     @abc.abstractmethod
     def get_table_name(self) -> str:
@@ -61,15 +194,227 @@ class BaseImporter(BaseCommand):
             self.stdout.write(f"Downloading data from {url}")
             tmp = tempfile.NamedTemporaryFile()
             urllib.request.urlretrieve(url, tmp.name)
-            self.tempdir = unzip(tmp.name)
-            self.data_path = Path(self.tempdir) / "Data"
+            with zipfile.ZipFile(tmp.name, "r") as zip_file:
+                self.archive_listing = [
+                    [info.filename, info.file_size, info.CRC]
+                    for info in zip_file.infolist()
+                ]
+            if options.get("stream"):
+                # Read the data files straight out of the zip
+                # instead of extracting them to disk first
+                self.archive_file = tmp
+                self.archive = zipfile.ZipFile(tmp.name, "r")
+            else:
+                self.tempdir = unzip(tmp.name)
+                self.data_path = Path(self.tempdir) / "Data"
 
         return data_path
 
+    def get_data_files(self, pattern="*.csv"):
+        """
+        Return the files in the data path (or the Data/ directory of the
+        archive, when streaming) which match pattern
+        """
+        if self.archive:
+            return sorted(
+                name
+                for name in self.archive.namelist()
+                if posixpath.dirname(name) == "Data"
+                and fnmatch.fnmatch(posixpath.basename(name), pattern)
+            )
+        return glob.glob(os.path.join(self.data_path, pattern))
+
+    def open_data_file(self, name):
+        if self.archive:
+            return io.TextIOWrapper(self.archive.open(name), encoding="utf-8")
+        return open(name, "r")  # noqa: SIM115
+
     @abc.abstractmethod
     def import_data_to_temp_table(self):
         pass
 
+    def run_in_parallel(self, func, items, workers):
+        """
+        Call func(cursor, item) for each item using `workers` threads.
+        Each call gets a cursor on its own database connection, so anything
+        it uses (e.g. the temp table) must have been committed already.
+        """
+
+        def run(item):
+            # connections are thread local, so this is a new connection
+            connection = connections[self.database]
+            try:
+                with connection.cursor() as cursor:
+                    return func(cursor, item)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(run, items))
+
+    def get_source(self, options):
+        """
+        Return a hash of where the data is coming from and the files in it.
+        This is recorded with each checkpoint, so that --resume doesn't
+        carry on an import of different data.
+        """
+        if self.archive_listing is not None:
+            source = {"url": options["url"], "files": self.archive_listing}
+        else:
+            data_path = os.path.abspath(self.data_path)
+            files = []
+            for dirpath, _, filenames in os.walk(data_path):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    stat = os.stat(path)
+                    files.append(
+                        [
+                            os.path.relpath(path, data_path),
+                            stat.st_size,
+                            stat.st_mtime_ns,
+                        ]
+                    )
+            source = {"data_path": data_path, "files": sorted(files)}
+        return hashlib.sha256(
+            json.dumps(source, sort_keys=True).encode()
+        ).hexdigest()
+
+    def get_checkpoints(self):
+        """
+        Return (phase, source, temp_table_oid) for each checkpoint recorded
+        for this table
+        """
+        self.cursor.execute(
+            f"""
+            SELECT phase, source, temp_table_oid
+            FROM {CHECKPOINT_TABLE} WHERE table_name = %s;
+        """,
+            [self.table_name],
+        )
+        return self.cursor.fetchall()
+
+    def get_completed_phases(self):
+        return {phase for phase, _, _ in self.get_checkpoints()}
+
+    def record_checkpoint(self, phase, cursor=None):
+        # The temp table's oid ties the checkpoint to this particular temp
+        # table, so we can tell if something else has replaced it since
+        cursor = cursor or self.cursor
+        cursor.execute(
+            f"""
+            INSERT INTO {CHECKPOINT_TABLE}
+                (table_name, phase, source, temp_table_oid, completed)
+            VALUES (%s, %s, %s, to_regclass(%s)::oid::bigint, now())
+            ON CONFLICT DO NOTHING;
+        """,
+            [self.table_name, phase, self.source, self.temp_table_name],
+        )
+        self.completed_phases.add(phase)
+
+    def clear_checkpoints(self):
+        self.cursor.execute(
+            f"DELETE FROM {CHECKPOINT_TABLE} WHERE table_name = %s;",
+            [self.table_name],
+        )
+        self.completed_phases = set()
+
+    def get_temp_table_oid(self):
+        self.cursor.execute(
+            "SELECT to_regclass(%s)::oid;", [self.temp_table_name]
+        )
+        return self.cursor.fetchone()[0]
+
+    def temp_table_exists(self):
+        return self.get_temp_table_oid() is not None
+
+    def run_phase(self, phase, func, *args, cursor=None):
+        """
+        Call func(*args), unless a previous run recorded `phase` as complete.
+        When resuming, record `phase` as complete once func has finished.
+        """
+        if phase in self.completed_phases:
+            self.stdout.write(f"Skipping {phase}, already completed")
+            return
+        func(*args)
+        if self.resume:
+            self.record_checkpoint(phase, cursor)
+
+    def apply_session_settings(self, cursor):
+        for name, value in self.session_settings.items():
+            self.stdout.write(f"Setting {name} to {value}")
+            cursor.execute("SELECT set_config(%s, %s, false);", [name, value])
+
+    def setup_resume(self):
+        checkpoints = self.get_checkpoints()
+        self.completed_phases = {phase for phase, _, _ in checkpoints}
+        if not checkpoints:
+            return
+
+        temp_table_oid = self.get_temp_table_oid()
+        if temp_table_oid is None:
+            restart_reason = f"{self.temp_table_name} not found"
+        elif any(source != self.source for _, source, _ in checkpoints):
+            restart_reason = (
+                "The checkpoints were recorded while importing different data"
+            )
+        elif any(oid != temp_table_oid for _, _, oid in checkpoints):
+            restart_reason = (
+                f"{self.temp_table_name} was not created by a --resume run "
+                "of this import"
+            )
+        elif self.temp_table_lost_data():
+            restart_reason = (
+                f"{self.temp_table_name} is an unlogged table and is empty. "
+                "It was probably truncated during crash recovery"
+            )
+        else:
+            restart_reason = None
+
+        if restart_reason:
+            self.stdout.write(f"{restart_reason}, starting import from scratch")
+            self.clear_checkpoints()
+        else:
+            self.stdout.write(
+                f"Resuming import into {self.temp_table_name}. "
+                f"Completed phases: {', '.join(sorted(self.completed_phases))}"
+            )
+
+    def temp_table_is_unlogged(self):
+        self.cursor.execute(
+            "SELECT relpersistence FROM pg_class WHERE oid = to_regclass(%s);",
+            [self.temp_table_name],
+        )
+        return self.cursor.fetchone()[0] == "u"
+
+    def temp_table_lost_data(self):
+        # Postgres truncates unlogged tables if the server crashes
+        if not self.temp_table_is_unlogged():
+            return False
+        self.cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {self.temp_table_name});"
+        )
+        return not self.cursor.fetchone()[0]
+
+    def create_and_populate_temp_table(self):
+        # Create empty temp tables
+        self.create_temp_table()
+
+        # Set temp table replica identity to full
+        self.alter_temp_table_replica_identity("FULL")
+
+        # import data into the temp table
+        self.import_data_to_temp_table()
+
+    def copy_data_files(self, files, copy_file):
+        """
+        Call copy_file(cursor, f) for each file, over --parallel connections
+        """
+        if self.parallel > 1:
+            self.run_in_parallel(copy_file, files, self.parallel)
+        else:
+            for f in files:
+                copy_file(self.cursor, f)
+
     def get_index_statements(self):
         self.cursor.execute(f"""
             SELECT tablename, indexname, indexdef 
@@ -121,11 +466,38 @@ class BaseImporter(BaseCommand):
 
     def build_temp_indexes(self):
         self.stdout.write(f"Building indexes on {self.temp_table_name}...")
-        for index in self.indexes:
-            self.stdout.write(
-                f"Executing: {index['temp_index_create_statement']}"
+        if self.index_workers > 1:
+            # Each index is built over its own connection
+            self.run_in_parallel(
+                self.build_temp_index_in_session,
+                self.indexes,
+                self.index_workers,
             )
-            self.cursor.execute(index["temp_index_create_statement"])
+        else:
+            for index in self.indexes:
+                self.run_phase(
+                    f"index:{index['index_name']}", self.build_temp_index, index
+                )
+
+    def build_temp_index_in_session(self, cursor, index):
+        self.apply_session_settings(cursor)
+        self.run_phase(
+            f"index:{index['index_name']}",
+            self.build_temp_index,
+            index,
+            cursor,
+            cursor=cursor,
+        )
+
+    def build_temp_index(self, index, cursor=None):
+        cursor = cursor or self.cursor
+        self.stdout.write(f"Executing: {index['temp_index_create_statement']}")
+        start = time.perf_counter()
+        cursor.execute(index["temp_index_create_statement"])
+        self.stdout.write(
+            f"Built {index['temp_index_name']} in "
+            f"{time.perf_counter() - start:.1f}s"
+        )
 
     def get_primary_key_constraint(self):
         pkey_sql = f"""
@@ -243,10 +615,47 @@ class BaseImporter(BaseCommand):
             f"Creating temp table called {self.temp_table_name}..."
         )
         self.cursor.execute(f"DROP TABLE IF EXISTS {self.temp_table_name};")
-        create_statement = f"CREATE TABLE {self.temp_table_name} AS SELECT * FROM {self.table_name} LIMIT 0;"
+        unlogged = "UNLOGGED " if self.unlogged_load else ""
+        create_statement = f"CREATE {unlogged}TABLE {self.temp_table_name} AS SELECT * FROM {self.table_name} LIMIT 0;"
         self.stdout.write(f"Executing: {create_statement}")
         self.cursor.execute(create_statement)
 
+    def get_logical_replication_slots(self):
+        self.cursor.execute("""
+            SELECT slot_name
+            FROM pg_replication_slots
+            WHERE slot_type = 'logical' AND database = current_database();
+        """)
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def check_unlogged_load_allowed(self):
+        # Logical decoding skips unlogged tables, and the rewrite when the
+        # table is set to logged, so subscribers would never receive the
+        # imported rows. Physical replicas get them from the rewrite.
+        slots = self.get_logical_replication_slots()
+        if not slots:
+            return
+        if not self.allow_logical_slots:
+            raise Exception(
+                f"Logical replication slots found: {', '.join(slots)}. "
+                "Logical replication won't see data loaded with "
+                "--unlogged-load. Pass --allow-logical-slots to load it "
+                "unlogged anyway."
+            )
+        self.stdout.write(
+            self.style.WARNING(
+                f"Loading {self.temp_table_name} unlogged even though there "
+                f"are logical replication slots: {', '.join(slots)}. "
+                "They won't see the imported data."
+            )
+        )
+
+    def set_temp_table_logged(self):
+        # This writes the whole table and its indexes to the WAL in one go
+        set_logged_statement = f"ALTER TABLE {self.temp_table_name} SET LOGGED;"
+        self.stdout.write(f"Executing: {set_logged_statement}")
+        self.cursor.execute(set_logged_statement)
+
     def alter_temp_table_replica_identity(self, identity):
         alter_table_statment = (
             f"ALTER TABLE {self.temp_table_name} REPLICA IDENTITY {identity};"
@@ -329,6 +738,7 @@ class BaseImporter(BaseCommand):
             )
 
         db_name = options["database"]
+        self.database = db_name
         self.connection = connections[db_name]
         self.cursor = self.connection.cursor()
 
@@ -336,26 +746,49 @@ class BaseImporter(BaseCommand):
             f"Connected to: {self.connection.settings_dict['NAME']} @ {self.connection.settings_dict['HOST'] if self.connection.settings_dict['HOST'] else 'localhost'}"
         )
 
+        self.parallel = options.get("parallel", 1)
+        self.unlogged_load = options.get("unlogged_load", False)
+        self.allow_logical_slots = options.get("allow_logical_slots", False)
+        if self.unlogged_load:
+            self.check_unlogged_load_allowed()
+        self.index_workers = options.get("index_workers", 1)
+        # applied to each connection we build indexes with
+        self.session_settings = {
+            name: str(options[name])
+            for name in [
+                "maintenance_work_mem",
+                "max_parallel_maintenance_workers",
+            ]
+            if options.get(name) is not None
+        }
+        self.apply_session_settings(self.cursor)
+
         self.get_data_path(options)
 
         self.get_constraints_and_index_statements()
 
-        try:
-            # Create empty temp tables
-            self.create_temp_table()
+        self.resume = options.get("resume", False)
+        self.completed_phases = set()
+        if self.resume:
+            self.source = self.get_source(options)
+            self.setup_resume()
 
-            # Set temp table replica identity to full
-            self.alter_temp_table_replica_identity("FULL")
-
-            # import data into the temp table
-            self.import_data_to_temp_table()
+        try:
+            # Create the temp table and import data into it
+            self.run_phase("import_data", self.create_and_populate_temp_table)
 
             # Add temp primary keys
-            self.add_temp_primary_key()
+            self.run_phase("primary_key", self.add_temp_primary_key)
 
             # Add temp indexes
             self.build_temp_indexes()
 
+            # Make sure the table we swap in is crash safe and replicated.
+            # Check the table rather than the flag, as a resumed import may
+            # have created it with --unlogged-load on an earlier run.
+            if self.temp_table_is_unlogged():
+                self.set_temp_table_logged()
+
             # Set temp table replica identity to default
             self.alter_temp_table_replica_identity("DEFAULT")
 
@@ -374,6 +807,11 @@ class BaseImporter(BaseCommand):
                 if self.foreign_key_constraints:
                     self.add_foreign_keys()
 
+            if self.resume:
+                self.clear_checkpoints()
+
+            clear_table_populated_cache(self.table_name)
+
         finally:
             self.db_cleanup()
             self.file_cleanup()
@@ -391,12 +829,23 @@ class BaseImporter(BaseCommand):
         self.stdout.write(f"Executing: {alter_table_statment}")
         self.cursor.execute(alter_table_statment)
 
+        if self.resume and self.completed_phases:
+            # Keep the temp table so a rerun can pick up where we left off
+            self.stdout.write(
+                f"Keeping {self.temp_table_name}. Run again with --resume "
+                "to continue the import."
+            )
+            return
+
         self.stdout.write("Dropping temp table if exists...")
         self.cursor.execute(
             f"DROP TABLE IF EXISTS {self.temp_table_name} CASCADE;"
         )
 
     def file_cleanup(self):
+        if self.archive:
+            self.archive.close()
+            self.archive_file.close()
         if self.tempdir:
             self.stdout.write(f"Cleaning up temp files in {self.tempdir}")
             try:
@@ -410,6 +859,12 @@ class BaseImporter(BaseCommand):
                 "Command appears to have been run against a local database. Skipping replication checks."
             )
             return
+        if self.unlogged_load:
+            self.stdout.write(
+                self.style.NOTICE(
+                    f"{self.temp_table_name} was loaded as an unlogged table, so its data was written to the WAL in one go when it was set to logged. Physical replicas may take a little while to catch up. Logical replication slots don't receive the imported rows."
+                )
+            )
         dbname = self.cursor.db.connection.info.dbname
         query_statement = f"""
             SELECT slot_name, wal_status, active, conflicting 
@@ -1,6 +1,8 @@
 import abc
+from collections import defaultdict
 
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection
 
 from uk_geo_utils.helpers import (
     AddressSorter,
@@ -8,6 +10,7 @@ from uk_geo_utils.helpers import (
     get_address_model,
     get_onspd_model,
     get_onsud_model,
+    table_is_populated,
 )
 
 
@@ -43,6 +46,15 @@ class OnspdNotImportedException(ObjectDoesNotExist):
     pass
 
 
+def _with_result_cache(queryset, records):
+    # Populate the result cache of a queryset with records we've already
+    # fetched (this is what prefetch_related() does) so that evaluating it
+    # doesn't need another round trip to the database
+    queryset._result_cache = list(records)
+    queryset._prefetch_done = True
+    return queryset
+
+
 class BaseGeocoder(metaclass=abc.ABCMeta):
     def __init__(self, postcode):
         self.postcode = Postcode(postcode)
@@ -58,31 +70,153 @@ class BaseGeocoder(metaclass=abc.ABCMeta):
 
 
 class AddressBaseGeocoder(BaseGeocoder):
-    def __init__(self, postcode):
+    def __init__(self, postcode, single_query=False):
         self.postcode = Postcode(postcode)
         if self.postcode.territory == "NI":
             raise NorthernIrelandException("Postcode is in Northern Ireland")
 
         self.onsud_model = get_onsud_model()
         self.address_model = get_address_model()
+        if not self.postcode.is_valid:
+            raise self.address_model.DoesNotExist(
+                "%s is not a valid postcode" % (self.postcode)
+            )
+        self.check_tables_populated(self.address_model, self.onsud_model)
+
+        if single_query:
+            # fetch addresses and ONSUD records in one query
+            rows = self.fetch_with_onsud(
+                self.address_model,
+                self.onsud_model,
+                [self.postcode.with_space],
+            )
+            self._set_records(
+                [address for address, _ in rows],
+                [record for _, record in rows if record],
+            )
+        else:
+            self._addresses = self.address_model.objects.filter(
+                postcode=self.postcode.with_space
+            ).order_by("uprn")
 
-        # check the data we need exists
-        if not self.address_model.objects.all().exists():
-            raise AddressBaseNotImportedException("Address Base table is empty")
-        if not self.onsud_model.objects.all().exists():
-            raise OnsudNotImportedException("ONSUD table is empty")
-
-        self._addresses = self.address_model.objects.filter(
-            postcode=self.postcode.with_space
-        ).order_by("uprn")
         if not self._addresses:
             raise self.address_model.DoesNotExist(
                 "No addresses found for postcode %s" % (self.postcode)
             )
 
-        self._uprns = self.onsud_model.objects.filter(
-            uprn__in=self.uprns
-        ).order_by("uprn")
+        if not single_query:
+            self._uprns = self.onsud_model.objects.filter(
+                uprn__in=self.uprns
+            ).order_by("uprn")
+
+    @staticmethod
+    def check_tables_populated(address_model, onsud_model):
+        # check the data we need exists
+        if not table_is_populated(address_model):
+            raise AddressBaseNotImportedException("Address Base table is empty")
+        if not table_is_populated(onsud_model):
+            raise OnsudNotImportedException("ONSUD table is empty")
+
+    @staticmethod
+    def fetch_with_onsud(address_model, onsud_model, postcodes):
+        """
+        Fetch the addresses in `postcodes` (formatted with a space),
+        joined to their ONSUD records on UPRN, in a single query.
+
+        Returns a list of (address, onsud_record) tuples ordered by UPRN.
+        onsud_record is None if the UPRN isn't in ONSUD.
+        """
+        qn = connection.ops.quote_name
+        address_table = qn(address_model._meta.db_table)
+        onsud_table = qn(onsud_model._meta.db_table)
+        address_pk = qn(address_model._meta.pk.column)
+        onsud_pk = qn(onsud_model._meta.pk.column)
+        onsud_fields = onsud_model._meta.concrete_fields
+        onsud_columns = ", ".join(
+            f"o.{qn(field.column)} AS {qn('onsud_' + field.attname)}"
+            for field in onsud_fields
+        )
+        addresses = address_model.objects.raw(
+            f"""
+            SELECT a.*, {onsud_columns}
+            FROM {address_table} a
+            LEFT JOIN {onsud_table} o ON o.{onsud_pk} = a.{address_pk}
+            WHERE a.postcode = ANY(%s)
+            ORDER BY a.{address_pk}
+            """,
+            [list(postcodes)],
+        )
+
+        rows = []
+        for address in addresses:
+            record = None
+            if getattr(address, "onsud_" + onsud_model._meta.pk.attname):
+                record = onsud_model.from_db(
+                    address._state.db,
+                    [field.attname for field in onsud_fields],
+                    [
+                        getattr(address, "onsud_" + field.attname)
+                        for field in onsud_fields
+                    ],
+                )
+            rows.append((address, record))
+        return rows
+
+    @classmethod
+    def bulk(cls, postcodes, batch_size=1000):
+        """
+        Construct geocoders for a list of postcodes using one query per
+        batch of postcodes, instead of several queries per postcode.
+
+        Returns a dict of geocoders keyed by postcode (without a space).
+        Postcodes which are invalid, in Northern Ireland or have no
+        addresses are omitted.
+        """
+        onsud_model = get_onsud_model()
+        address_model = get_address_model()
+        cls.check_tables_populated(address_model, onsud_model)
+
+        wanted = {}
+        for postcode in postcodes:
+            postcode = Postcode(postcode)
+            if postcode.territory != "NI" and postcode.is_valid:
+                wanted[postcode.with_space] = postcode
+        postcodes = list(wanted)
+
+        geocoders = {}
+        for i in range(0, len(postcodes), batch_size):
+            rows = defaultdict(list)
+            for address, record in cls.fetch_with_onsud(
+                address_model, onsud_model, postcodes[i : i + batch_size]
+            ):
+                rows[address.postcode].append((address, record))
+
+            for with_space, postcode_rows in rows.items():
+                postcode = wanted[with_space]
+                geocoder = cls.__new__(cls)
+                geocoder.postcode = postcode
+                geocoder.onsud_model = onsud_model
+                geocoder.address_model = address_model
+                geocoder._set_records(
+                    [address for address, _ in postcode_rows],
+                    [record for _, record in postcode_rows if record],
+                )
+                geocoders[postcode.without_space] = geocoder
+        return geocoders
+
+    def _set_records(self, addresses, onsud_records):
+        self._addresses = _with_result_cache(
+            self.address_model.objects.filter(
+                postcode=self.postcode.with_space
+            ).order_by("uprn"),
+            addresses,
+        )
+        self._uprns = _with_result_cache(
+            self.onsud_model.objects.filter(uprn__in=self.uprns).order_by(
+                "uprn"
+            ),
+            onsud_records,
+        )
 
     @property
     def uprns(self):
@@ -90,7 +224,12 @@ class AddressBaseGeocoder(BaseGeocoder):
 
     @property
     def centroid(self):
-        type_d_addresses = self._addresses.filter(addressbase_postal="D")
+        # filter the addresses we've already got, rather than going back
+        # to the database for the type D ones
+        type_d_addresses = _with_result_cache(
+            self._addresses.filter(addressbase_postal="D"),
+            [a for a in self._addresses if a.addressbase_postal == "D"],
+        )
         if len(type_d_addresses) > 0:
             return type_d_addresses.centroid
         return self._addresses.centroid
@@ -144,8 +283,12 @@ class OnspdGeocoder(BaseGeocoder):
     def __init__(self, postcode):
         self.postcode = Postcode(postcode)
         self.onspd_model = get_onspd_model()
+        if not self.postcode.is_valid:
+            raise self.onspd_model.DoesNotExist(
+                "%s is not a valid postcode" % (self.postcode)
+            )
 
-        if not self.onspd_model.objects.all().exists():
+        if not table_is_populated(self.onspd_model):
             raise OnspdNotImportedException("ONSPD table is empty")
 
         self.record = self.onspd_model.objects.get(
@@ -158,3 +301,30 @@ class OnspdGeocoder(BaseGeocoder):
 
     def get_code(self, code_type):
         return getattr(self.record, code_type)
+
+
+class OnspdStoreGeocoder(BaseGeocoder):
+    """
+    Like OnspdGeocoder, but looks the postcode up in an
+    uk_geo_utils.onspd_store.OnspdStore instead of the database
+    """
+
+    def __init__(self, postcode, store):
+        self.postcode = Postcode(postcode)
+        self.store = store
+        if not self.postcode.is_valid:
+            raise store.model.DoesNotExist(
+                "%s is not a valid postcode" % (self.postcode)
+            )
+
+        if not len(store):
+            raise OnspdNotImportedException("ONSPD store is empty")
+
+        self.row = store.get_row(self.postcode.with_space)
+
+    @property
+    def centroid(self):
+        return self.store.get_centroid(self.row)
+
+    def get_code(self, code_type):
+        return self.store.get_code(self.row, code_type)
@@ -1,4 +1,7 @@
+import functools
 import re
+import time
+from collections import namedtuple
 
 from django.apps import apps
 from django.conf import settings
@@ -25,11 +28,121 @@ def get_onspd_model():
     return get_model("ONSPD_MODEL", "uk_geo_utils.Onspd")
 
 
+# db_table -> time.monotonic() value until which we trust that it has data
+_populated_tables = {}
+
+
+def table_is_populated(model):
+    """
+    Check if there are any records in the table for `model`.
+
+    If settings.GEOCODER_TABLE_CHECK_TTL is set, a positive result is
+    remembered for that many seconds so we don't need to query the database
+    again. Empty tables are never cached.
+    """
+    ttl = getattr(settings, "GEOCODER_TABLE_CHECK_TTL", 0)
+    table_name = model._meta.db_table
+    if ttl and _populated_tables.get(table_name, 0) > time.monotonic():
+        return True
+
+    populated = model.objects.all().exists()
+    if populated and ttl:
+        _populated_tables[table_name] = time.monotonic() + ttl
+    return populated
+
+
+def clear_table_populated_cache(table_name=None):
+    """
+    Forget cached table_is_populated() results for `table_name`,
+    or for all tables if no table name is given.
+    """
+    if table_name is None:
+        _populated_tables.clear()
+    else:
+        _populated_tables.pop(table_name, None)
+
+
+# Upper-cases ASCII letters and deletes anything which isn't [A-Z0-9]
+_POSTCODE_TRANSLATION = {
+    i: (chr(i).upper() if chr(i).isalnum() else None) for i in range(128)
+}
+_NOT_POSTCODE_CHARS = re.compile("[^A-Z0-9]")
+
+
+def _normalise_postcode(postcode):
+    if postcode.isascii():
+        return postcode.translate(_POSTCODE_TRANSLATION)
+    # upper() can turn non-ASCII characters into ASCII ones (e.g. ß -> SS)
+    return _NOT_POSTCODE_CHARS.sub("", postcode.upper())
+
+
+# The shapes of a UK postcode (without a space), plus the special cases:
+# A9 9AA, A99 9AA, AA9 9AA, AA99 9AA, A9A 9AA, AA9A 9AA,
+# GIR 0AA, BFPO postcodes (BFPO 1 - BFPO 9999) and the overseas territories
+_POSTCODE_GRAMMAR = re.compile(
+    "[A-Z][A-Z]?[0-9][0-9A-Z]?[0-9][A-Z]{2}"
+    "|GIR0AA"
+    "|BFPO[0-9]{1,4}"
+    "|(?:ASCN|BBND|BIQQ|FIQQ|PCRN|SIQQ|STHL|TDCU|TKCA)1ZZ"
+)
+_is_valid_postcode = _POSTCODE_GRAMMAR.fullmatch
+
+
+NormalisedPostcode = namedtuple(
+    "NormalisedPostcode",
+    ["outcode", "incode", "with_space", "without_space", "territory"],
+)
+
+
+# Recently seen postcode strings -> (without_space, with_space, territory).
+# It's emptied when it fills up, which is much cheaper than keeping it in
+# least recently used order, so a miss costs little more than no cache.
+_postcode_cache = {}
+_POSTCODE_CACHE_SIZE = 4096
+
+
 class Postcode:
-    def __init__(self, postcode, validate=False):
-        self.postcode = re.sub("[^A-Z0-9]", "", str(postcode).upper())
+    # with_space and territory are worked out up front,
+    # so accessing them is just an attribute lookup
+    __slots__ = ("postcode", "with_space", "territory")
+
+    def __init__(self, postcode, validate=False, strict=False):
+        if isinstance(postcode, Postcode):
+            self.postcode = postcode.postcode
+            self.with_space = postcode.with_space
+            self.territory = postcode.territory
+        else:
+            if type(postcode) is not str:
+                postcode = str(postcode)
+            parsed = _postcode_cache.get(postcode)
+            if parsed is None:
+                normalised = _normalise_postcode(postcode)
+                parsed = (
+                    normalised,
+                    normalised[:-3] + " " + normalised[-3:],
+                    "NI" if normalised[:2] == "BT" else "GB",
+                )
+                if len(_postcode_cache) >= _POSTCODE_CACHE_SIZE:
+                    _postcode_cache.clear()
+                _postcode_cache[postcode] = parsed
+            self.postcode, self.with_space, self.territory = parsed
         if validate and len(str(self.postcode)) < 5:
             raise ValueError("Postcode must have at least 5 characters")
+        if strict and not self.is_valid:
+            raise ValueError("%s is not a valid UK postcode" % self.postcode)
+
+    @classmethod
+    def normalise(cls, postcode):
+        """
+        Return postcode upper-cased with everything but letters and numbers
+        removed (i.e. Postcode(postcode).without_space), without creating
+        a Postcode object. Recently seen postcodes are cached.
+        """
+        postcode = str(postcode)
+        parsed = _postcode_cache.get(postcode)
+        if parsed is None:
+            return _normalise_postcode(postcode)
+        return parsed[0]
 
     def __str__(self):
         return self.without_space
@@ -41,20 +154,160 @@ class Postcode:
             and self.without_space == other.without_space
         )
 
-    @property
-    def territory(self):
-        if self.postcode[:2] == "BT":
-            return "NI"
-        return "GB"
-
-    @property
-    def with_space(self):
-        return self.postcode[:-3] + " " + self.postcode[-3:]
+    def __hash__(self):
+        return hash(self.postcode)
 
     @property
     def without_space(self):
         return self.postcode
 
+    @property
+    def is_valid(self):
+        """
+        Check the postcode against the format of a UK postcode. This only
+        checks the postcode is well-formed, not that it exists.
+        """
+        return _is_valid_postcode(self.postcode) is not None
+
+
+def normalise_postcodes(postcodes, validate=False, strict=False):
+    """
+    Generate a NormalisedPostcode (outcode, incode, with_space,
+    without_space, territory) for each postcode in an iterable, following
+    the same rules as Postcode but without creating Postcode objects.
+
+    If validate (or strict) is True, None is generated in place of
+    postcodes which Postcode(postcode, validate=validate, strict=strict)
+    would reject.
+    """
+    # Bulk inputs are mostly distinct, so this doesn't use (or flush) the
+    # cache Postcode uses. Locals and tuple.__new__ save attribute lookups
+    # and the namedtuple constructor's overhead on every postcode.
+    translation = _POSTCODE_TRANSLATION
+    normalise = _normalise_postcode
+    is_valid = _is_valid_postcode
+    new = tuple.__new__
+    cls = NormalisedPostcode
+    for postcode in postcodes:
+        if type(postcode) is not str:
+            postcode = str(postcode)
+        if postcode.isascii():
+            postcode = postcode.translate(translation)
+        else:
+            postcode = normalise(postcode)
+        if (validate and len(postcode) < 5) or (
+            strict and not is_valid(postcode)
+        ):
+            yield None
+            continue
+        outcode = postcode[:-3]
+        incode = postcode[-3:]
+        yield new(
+            cls,
+            (
+                outcode,
+                incode,
+                outcode + " " + incode,
+                postcode,
+                "NI" if postcode[:2] == "BT" else "GB",
+            ),
+        )
+
+
+def validate_postcodes(postcodes, strict=False):
+    """
+    Generate True or False for each postcode in an iterable, depending on
+    whether Postcode(postcode, validate=True, strict=strict) would accept it
+    """
+    for parsed in normalise_postcodes(postcodes, validate=True, strict=strict):
+        yield parsed is not None
+
+
+def format_paf_label(fields):
+    """
+    Construct an address label from a tuple of PAF address fields, in the
+    order PAFAddressFormatter takes them.
+
+    Non-empty premises elements are added to the address label in the
+    order of organisation_name, department_name, po_box_number (which
+    must be prepended with 'PO Box'), sub_building_name, building_name,
+    building_number, then the rest of the elements except for Town and
+    Postcode because we want them in their own fields. This isn't strict
+    address label but we're probably loading them into a database.
+
+    Elements are added as a new line on the label except when the previous
+    line fulfils the "exception rule", in which case the element is
+    concatenated onto it:
+
+    i) First and last characters of the Building Name are numeric
+      (eg '1to1' or '100:1')
+    ii) First and penultimate characters are numeric, last character is
+      alphabetic (eg '12A')
+    iii) Building Name has only one character (eg 'A')
+
+    Finally the post town goes on the 6th line of the label, replacing
+    anything already there.
+    """
+    (
+        organisation_name,
+        department_name,
+        po_box_number,
+        sub_building_name,
+        building_name,
+        building_number,
+        dependent_thoroughfare,
+        thoroughfare,
+        post_town,
+        double_dependent_locality,
+        dependent_locality,
+    ) = fields
+
+    label = []
+    if organisation_name:
+        label.append(organisation_name)
+    if department_name:
+        label.append(department_name)
+    if po_box_number:
+        label.append("PO Box " + po_box_number)
+
+    for element in (
+        sub_building_name,
+        building_name,
+        building_number,
+        dependent_thoroughfare,
+        thoroughfare,
+        double_dependent_locality,
+        dependent_locality,
+    ):
+        if not element:
+            continue
+        if label:
+            last = label[-1]
+            if (
+                last[0].isdigit()
+                and (
+                    last[-1].isdigit()
+                    or (
+                        len(last) > 1
+                        and last[-2].isdigit()
+                        and last[-1].isalpha()
+                    )
+                )
+            ) or (len(last) == 1 and last.isalpha()):
+                label[-1] = last + " " + element
+                continue
+        label.append(element)
+
+    if post_town:
+        if len(label) > 5:
+            label[5] = post_town
+        else:
+            label.append(post_town)
+    elif len(label) > 5:
+        del label[5]
+
+    return ", ".join(label)
+
 
 class PAFAddressFormatter:
     def __init__(
@@ -83,91 +336,93 @@ class PAFAddressFormatter:
         self.post_town = post_town
         self.double_dependent_locality = double_dependent_locality
         self.dependent_locality = dependent_locality
-        self.address_label = []
 
     def generate_address_label(self):
-        """Construct a list for address label.
-
-        Non-empty premises elements are appended to the address label in the
-        order of organisation_name, department_name, po_box_number (which
-        must be prepended with 'PO Box', sub_building_name, building_name,
-        building_number, then the rest of the elements except for Town and
-        Postcode because we want them in their own fields. This isn't strict
-        address label but we're probably loading them into a database.
-        """
-        if self.organisation_name:
-            self.address_label.append(self.organisation_name)
-        if self.department_name:
-            self.address_label.append(self.department_name)
-        if self.po_box_number:
-            self.address_label.append("PO Box " + self.po_box_number)
-
-        elements = [
-            self.sub_building_name,
-            self.building_name,
-            self.building_number,
-            self.dependent_thoroughfare,
-            self.thoroughfare,
-            self.double_dependent_locality,
-            self.dependent_locality,
-        ]
-
-        for element in elements:
-            if element:
-                self._append_to_label(element)
-
-        # pad label to length of 7 if not already
-        if len(self.address_label) < 7:
-            for i in range(7 - len(self.address_label)):
-                self.address_label.append("")
-
-        # finally, add post town
-        self.address_label[5] = self.post_town
-
-        return ", ".join([f for f in self.address_label if f])
-
-    def _is_exception_rule(self, element):
-        """Check for "exception rule".
-
-        Address elements will be appended onto a new line on the label except
-        for when the penultimate lable line fulfils certain criteria, in which
-        case the element will be concatenated onto the penultimate line. This
-        method checks for those criteria.
+        """Construct the address label. See format_paf_label()."""
+        return format_paf_label(
+            (
+                self.organisation_name,
+                self.department_name,
+                self.po_box_number,
+                self.sub_building_name,
+                self.building_name,
+                self.building_number,
+                self.dependent_thoroughfare,
+                self.thoroughfare,
+                self.post_town,
+                self.double_dependent_locality,
+                self.dependent_locality,
+            )
+        )
 
-        i) First and last characters of the Building Name are numeric
-          (eg '1to1' or '100:1')
-        ii) First and penultimate characters are numeric, last character is
-          alphabetic (eg '12A')
-        iii) Building Name has only one character (eg 'A')
-        """
-        if element[0].isdigit() and element[-1].isdigit():
-            return True
-        if (
-            len(element) > 1
-            and element[0].isdigit()
-            and element[-2].isdigit()
-            and element[-1].isalpha()
-        ):
-            return True
-        return bool(len(element) == 1 and element.isalpha())
+    def __str__(self):
+        """Return the label form of the address."""
+        return ",".join(self.generate_address_label())
 
-    def _append_to_label(self, element):
-        """Append address element to the label.
 
-        Normally an element will be appended onto the list, except where the
-        existing last element fulfils the exception rule, in which case the
-        element will be concatenated onto the final list member.
-        """
-        if len(self.address_label) > 0 and self._is_exception_rule(
-            self.address_label[-1]
-        ):
-            self.address_label[-1] += " " + element
+@functools.lru_cache(maxsize=4096)
+def _format_number_range(start_number, start_suffix, end_number, end_suffix):
+    # The numbers part of an addressable object, e.g. "12A-14 ". Based on
+    # SQL from
+    # https://www.ordnancesurvey.co.uk/documents/addressbase-products-getting-started-guide1.pdf
+    # page 57-59. The same few combinations come up over and over again,
+    # so these are cached.
+    if not end_number:
+        if start_suffix:
+            number_range = start_number + start_suffix + " "
+        elif start_number:
+            number_range = start_number + " "
         else:
-            self.address_label.append(element)
+            number_range = ""
+    else:
+        number_range = start_number
+        if start_suffix:
+            number_range += start_suffix
+        if end_suffix or start_number:
+            number_range += "-"
+        number_range += end_number if end_suffix else end_number + " "
+    if end_suffix:
+        number_range += end_suffix + " "
+    return number_range
+
+
+def format_local_auth_label(fields):
+    """
+    Construct an address label from a tuple of AddressBase local authority
+    address fields, in the order LocalAuthAddressFormatter takes them.
+    """
+    (
+        organisation_name,
+        sao_start_number,
+        sao_start_suffix,
+        sao_end_number,
+        sao_end_suffix,
+        sao_text,
+        pao_start_number,
+        pao_start_suffix,
+        pao_end_number,
+        pao_end_suffix,
+        pao_text,
+        street_description,
+        locality,
+        town_name,
+    ) = fields
 
-    def __str__(self):
-        """Return the label form of the address."""
-        return ",".join(self.generate_address_label())
+    sao = _format_number_range(
+        sao_start_number, sao_start_suffix, sao_end_number, sao_end_suffix
+    )
+    if sao_text:
+        sao = sao_text + " " + sao
+    pao = _format_number_range(
+        pao_start_number, pao_start_suffix, pao_end_number, pao_end_suffix
+    )
+    if pao_text:
+        pao = pao_text + " " + pao
+
+    add_line2 = sao + pao + street_description
+    return ", ".join(
+        [f for f in (organisation_name, add_line2, locality, town_name) if f]
+    )
 
 
 class LocalAuthAddressFormatter:
@@ -226,51 +481,33 @@ class LocalAuthAddressFormatter:
     def _get_addressable_object(
         self, text, start_number, start_suffix, end_number, end_suffix
     ):
-        # based on SQL from
-        # https://www.ordnancesurvey.co.uk/documents/addressbase-products-getting-started-guide1.pdf
-        # page 57-59
-        ao = ""
+        ao = _format_number_range(
+            start_number, start_suffix, end_number, end_suffix
+        )
         if text:
-            ao = ao + text + " "
-
-        if start_number and not start_suffix and not end_number:
-            ao = ao + start_number + " "
-        else:
-            ao = ao + start_number
-
-        if start_suffix and not end_number:
-            ao = ao + start_suffix + " "
-        elif start_suffix and end_number:
-            ao = ao + start_suffix
-
-        if (end_suffix and end_number) or (start_number and end_number):
-            ao = ao + "-"
-
-        if end_number and not end_suffix:
-            ao = ao + end_number + " "
-        elif not end_number:
-            ao = ao + ""
-        else:
-            ao = ao + end_number
-
-        if end_suffix:
-            ao = ao + end_suffix + " "
-
+            return text + " " + ao
         return ao
 
     def generate_address_label(self):
-        add_line2 = (
-            self.secondary_addressable_object
-            + self.primary_addressable_object
-            + self.street_description
+        """Construct the address label. See format_local_auth_label()."""
+        return format_local_auth_label(
+            (
+                self.organisation_name,
+                self.sao_start_number,
+                self.sao_start_suffix,
+                self.sao_end_number,
+                self.sao_end_suffix,
+                self.sao_text,
+                self.pao_start_number,
+                self.pao_start_suffix,
+                self.pao_end_number,
+                self.pao_end_suffix,
+                self.pao_text,
+                self.street_description,
+                self.locality,
+                self.town_name,
+            )
         )
-        address_label = [
-            self.organisation_name,
-            add_line2,
-            self.locality,
-            self.town_name,
-        ]
-        return ", ".join([f for f in address_label if f])
 
 
 class AddressSorter:
@@ -1,192 +1,273 @@
 import csv
 import glob
 import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
 
 from django.core.management.base import BaseCommand
 
-from uk_geo_utils.helpers import LocalAuthAddressFormatter, PAFAddressFormatter
+from uk_geo_utils.helpers import format_local_auth_label, format_paf_label
 
+FIELDNAMES = [
+    "UPRN",
+    "UDPRN",
+    "CHANGE_TYPE",
+    "STATE",
+    "STATE_DATE",
+    "CLASS",
+    "PARENT_UPRN",
+    "X_COORDINATE",
+    "Y_COORDINATE",
+    "LATITUDE",
+    "LONGITUDE",
+    "RPC",
+    "LOCAL_CUSTODIAN_CODE",
+    "COUNTRY",
+    "LA_START_DATE",
+    "LAST_UPDATE_DATE",
+    "ENTRY_DATE",
+    "RM_ORGANISATION_NAME",
+    "LA_ORGANISATION",
+    "DEPARTMENT_NAME",
+    "LEGAL_NAME",
+    "SUB_BUILDING_NAME",
+    "BUILDING_NAME",
+    "BUILDING_NUMBER",
+    "SAO_START_NUMBER",
+    "SAO_START_SUFFIX",
+    "SAO_END_NUMBER",
+    "SAO_END_SUFFIX",
+    "SAO_TEXT",
+    "ALT_LANGUAGE_SAO_TEXT",
+    "PAO_START_NUMBER",
+    "PAO_START_SUFFIX",
+    "PAO_END_NUMBER",
+    "PAO_END_SUFFIX",
+    "PAO_TEXT",
+    "ALT_LANGUAGE_PAO_TEXT",
+    "USRN",
+    "USRN_MATCH_INDICATOR",
+    "AREA_NAME",
+    "LEVEL",
+    "OFFICIAL_FLAG",
+    "OS_ADDRESS_TOID",
+    "OS_ADDRESS_TOID_VERSION",
+    "OS_ROADLINK_TOID",
+    "OS_ROADLINK_TOID_VERSION",
+    "OS_TOPO_TOID",
+    "OS_TOPO_TOID_VERSION",
+    "VOA_CT_RECORD",
+    "VOA_NDR_RECORD",
+    "STREET_DESCRIPTION",
+    "ALT_LANGUAGE_STREET_DESCRIPTION",
+    "DEPENDENT_THOROUGHFARE",
+    "THOROUGHFARE",
+    "WELSH_DEPENDENT_THOROUGHFARE",
+    "WELSH_THOROUGHFARE",
+    "DOUBLE_DEPENDENT_LOCALITY",
+    "DEPENDENT_LOCALITY",
+    "LOCALITY",
+    "WELSH_DEPENDENT_LOCALITY",
+    "WELSH_DOUBLE_DEPENDENT_LOCALITY",
+    "TOWN_NAME",
+    "ADMINISTRATIVE_AREA",
+    "POST_TOWN",
+    "WELSH_POST_TOWN",
+    "POSTCODE",
+    "POSTCODE_LOCATOR",
+    "POSTCODE_TYPE",
+    "DELIVERY_POINT_SUFFIX",
+    "ADDRESSBASE_POSTAL",
+    "PO_BOX_NUMBER",
+    "WARD_CODE",
+    "PARISH_CODE",
+    "RM_START_DATE",
+    "MULTI_OCC_COUNT",
+    "VOA_NDR_P_DESC_CODE",
+    "VOA_NDR_SCAT_CODE",
+    "ALT_LANGUAGE",
+]
+FIELD = {name: i for i, name in enumerate(FIELDNAMES)}
+UPRN = FIELD["UPRN"]
+COUNTRY = FIELD["COUNTRY"]
+LATITUDE = FIELD["LATITUDE"]
+LONGITUDE = FIELD["LONGITUDE"]
+POSTCODE = FIELD["POSTCODE"]
+POSTCODE_LOCATOR = FIELD["POSTCODE_LOCATOR"]
+ADDRESSBASE_POSTAL = FIELD["ADDRESSBASE_POSTAL"]
 
-class Command(BaseCommand):
-    def add_arguments(self, parser):
-        parser.add_argument(
-            "ab_path",
-            help="The path to the folder containing the AddressBase CSVs",
-        )
-
-    def handle(self, *args, **kwargs):
-        self.fieldnames = [
-            "UPRN",
-            "UDPRN",
-            "CHANGE_TYPE",
-            "STATE",
-            "STATE_DATE",
-            "CLASS",
-            "PARENT_UPRN",
-            "X_COORDINATE",
-            "Y_COORDINATE",
-            "LATITUDE",
-            "LONGITUDE",
-            "RPC",
-            "LOCAL_CUSTODIAN_CODE",
-            "COUNTRY",
-            "LA_START_DATE",
-            "LAST_UPDATE_DATE",
-            "ENTRY_DATE",
+# Pick out the fields format_paf_label and format_local_auth_label
+# take, in the order they take them, from a row as a tuple
+get_paf_fields = itemgetter(
+    *(
+        FIELD[name]
+        for name in [
             "RM_ORGANISATION_NAME",
-            "LA_ORGANISATION",
             "DEPARTMENT_NAME",
-            "LEGAL_NAME",
+            "PO_BOX_NUMBER",
             "SUB_BUILDING_NAME",
             "BUILDING_NAME",
             "BUILDING_NUMBER",
+            "DEPENDENT_THOROUGHFARE",
+            "THOROUGHFARE",
+            "POST_TOWN",
+            "DOUBLE_DEPENDENT_LOCALITY",
+            "DEPENDENT_LOCALITY",
+        ]
+    )
+)
+get_local_auth_fields = itemgetter(
+    *(
+        FIELD[name]
+        for name in [
+            "LA_ORGANISATION",
             "SAO_START_NUMBER",
             "SAO_START_SUFFIX",
             "SAO_END_NUMBER",
             "SAO_END_SUFFIX",
             "SAO_TEXT",
-            "ALT_LANGUAGE_SAO_TEXT",
             "PAO_START_NUMBER",
             "PAO_START_SUFFIX",
             "PAO_END_NUMBER",
             "PAO_END_SUFFIX",
             "PAO_TEXT",
-            "ALT_LANGUAGE_PAO_TEXT",
-            "USRN",
-            "USRN_MATCH_INDICATOR",
-            "AREA_NAME",
-            "LEVEL",
-            "OFFICIAL_FLAG",
-            "OS_ADDRESS_TOID",
-            "OS_ADDRESS_TOID_VERSION",
-            "OS_ROADLINK_TOID",
-            "OS_ROADLINK_TOID_VERSION",
-            "OS_TOPO_TOID",
-            "OS_TOPO_TOID_VERSION",
-            "VOA_CT_RECORD",
-            "VOA_NDR_RECORD",
             "STREET_DESCRIPTION",
-            "ALT_LANGUAGE_STREET_DESCRIPTION",
-            "DEPENDENT_THOROUGHFARE",
-            "THOROUGHFARE",
-            "WELSH_DEPENDENT_THOROUGHFARE",
-            "WELSH_THOROUGHFARE",
-            "DOUBLE_DEPENDENT_LOCALITY",
-            "DEPENDENT_LOCALITY",
             "LOCALITY",
-            "WELSH_DEPENDENT_LOCALITY",
-            "WELSH_DOUBLE_DEPENDENT_LOCALITY",
             "TOWN_NAME",
-            "ADMINISTRATIVE_AREA",
-            "POST_TOWN",
-            "WELSH_POST_TOWN",
-            "POSTCODE",
-            "POSTCODE_LOCATOR",
-            "POSTCODE_TYPE",
-            "DELIVERY_POINT_SUFFIX",
-            "ADDRESSBASE_POSTAL",
-            "PO_BOX_NUMBER",
-            "WARD_CODE",
-            "PARISH_CODE",
-            "RM_START_DATE",
-            "MULTI_OCC_COUNT",
-            "VOA_NDR_P_DESC_CODE",
-            "VOA_NDR_SCAT_CODE",
-            "ALT_LANGUAGE",
         ]
+    )
+)
+
+
+def clean_file(csv_path, out_path):
+    """
+    Clean a single AddressBase Plus CSV, writing the output to out_path.
+    This is a module-level function so it can be run in a worker process.
+    """
+    cmd = Command()
+    with open(out_path, "w") as out_file:
+        cmd.out_csv = csv.writer(out_file)
+        return cmd.clean_csv(csv_path)
+
+
+class Command(BaseCommand):
+    fieldnames = FIELDNAMES
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "ab_path",
+            help="The path to the folder containing the AddressBase CSVs",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes to use to clean the files in parallel",
+        )
+
+    def handle(self, *args, **kwargs):
         self.base_path = os.path.abspath(kwargs["ab_path"])
         out_path = os.path.join(self.base_path, "addressbase_cleaned.csv")
 
-        files = glob.glob(os.path.join(self.base_path, "*.csv"))
-        if not files:
-            raise FileNotFoundError(
-                "No CSV files found in %s" % (self.base_path)
+        files = self.get_files(self.base_path)
+
+        start = time.monotonic()
+        if kwargs.get("workers", 1) > 1:
+            rows = self.clean_files_in_parallel(
+                files, out_path, kwargs["workers"]
             )
+        else:
+            rows = 0
+            with open(out_path, "w") as out_file:
+                self.out_csv = csv.writer(out_file)
+                for csv_path in files:
+                    self.stdout.write(csv_path)
+                    rows += self.clean_csv(csv_path)
+                    out_file.flush()
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(
+            f"Cleaned {rows} rows in {elapsed:.1f}s "
+            f"({rows / max(elapsed, 0.001):.0f} rows/s)"
+        )
+
+    def get_files(self, base_path):
+        files = glob.glob(os.path.join(base_path, "*.csv"))
+        if not files:
+            raise FileNotFoundError("No CSV files found in %s" % (base_path))
+        return sorted(f for f in files if not f.endswith("cleaned.csv"))
+
+    def clean_files_in_parallel(self, files, out_path, workers):
+        # Each worker cleans whole files into its own part file. The parts
+        # are then concatenated in the same order as the input files, so
+        # the output is the same as cleaning the files one at a time.
+        tmpdir = tempfile.mkdtemp(dir=self.base_path)
+        try:
+            parts = [
+                os.path.join(tmpdir, f"part_{i}.csv") for i in range(len(files))
+            ]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                counts = list(executor.map(clean_file, files, parts))
+                for csv_path, count in zip(files, counts):
+                    self.stdout.write(f"{csv_path}: {count} rows")
 
-        with open(out_path, "w") as out_file:
-            for csv_path in files:
-                if csv_path.endswith("cleaned.csv"):
-                    continue
-                self.out_csv = csv.DictWriter(
-                    out_file,
-                    fieldnames=[
-                        "UPRN",
-                        "address",
-                        "postcode",
-                        "location",
-                        "addressbase_postal",
-                    ],
-                )
-                self.stdout.write(csv_path)
-                self.clean_csv(csv_path)
-                out_file.flush()
+            # copy the bytes, so the line endings are left as the workers
+            # wrote them
+            with open(out_path, "wb") as out_file:
+                for part in parts:
+                    with open(part, "rb") as part_file:
+                        shutil.copyfileobj(part_file, out_file)
+            return sum(counts)
+        finally:
+            shutil.rmtree(tmpdir)
 
     def line_filter(self, csv_path):
         with open(csv_path) as csv_file:
-            for line in csv.DictReader(csv_file, fieldnames=self.fieldnames):
+            for line in csv.reader(csv_file):
                 """
+                - Skip blank lines
                 - Get rid of type N UPRNs (but keep type C, D and L)
                 - Get rid of records in the Isle of Man/Channel Islands
                   (but keep England, Wales, Scotland and NI)
                 """
-                if line["ADDRESSBASE_POSTAL"] != "N" and line["COUNTRY"] in [
-                    "E",
-                    "W",
-                    "S",
-                    "N",
-                ]:
+                if (
+                    line
+                    and line[ADDRESSBASE_POSTAL] != "N"
+                    and line[COUNTRY] in ("E", "W", "S", "N")
+                ):
                     yield line
 
     def clean_csv(self, csv_path):
+        rows = 0
         for line in self.line_filter(csv_path):
             self.out_csv.writerow(self.clean_output_line(line))
+            rows += 1
+        return rows
+
+    def clean_files(self, files):
+        """Generate cleaned rows (as tuples) for all of the CSVs in files"""
+        for csv_path in files:
+            self.stdout.write(csv_path)
+            for line in self.line_filter(csv_path):
+                yield self.clean_output_line(line)
 
     def clean_address(self, line):
-        if line["ADDRESSBASE_POSTAL"] == "D":
-            address_fields = [
-                "DEPARTMENT_NAME",
-                "PO_BOX_NUMBER",
-                "SUB_BUILDING_NAME",
-                "BUILDING_NAME",
-                "BUILDING_NUMBER",
-                "DEPENDENT_THOROUGHFARE",
-                "THOROUGHFARE",
-                "DOUBLE_DEPENDENT_LOCALITY",
-                "DEPENDENT_LOCALITY",
-                "POST_TOWN",
-            ]
-            kwargs = {k.lower(): line[k] for k in line if k in address_fields}
-            kwargs["organisation_name"] = line["RM_ORGANISATION_NAME"]
-            return PAFAddressFormatter(**kwargs).generate_address_label()
-        address_fields = [
-            "SAO_START_NUMBER",
-            "SAO_START_SUFFIX",
-            "SAO_END_NUMBER",
-            "SAO_END_SUFFIX",
-            "SAO_TEXT",
-            "PAO_START_NUMBER",
-            "PAO_START_SUFFIX",
-            "PAO_END_NUMBER",
-            "PAO_END_SUFFIX",
-            "PAO_TEXT",
-            "STREET_DESCRIPTION",
-            "LOCALITY",
-            "TOWN_NAME",
-        ]
-        kwargs = {k.lower(): line[k] for k in line if k in address_fields}
-        kwargs["organisation_name"] = line["LA_ORGANISATION"]
-        return LocalAuthAddressFormatter(**kwargs).generate_address_label()
+        if line[ADDRESSBASE_POSTAL] == "D":
+            return format_paf_label(get_paf_fields(line))
+        return format_local_auth_label(get_local_auth_fields(line))
 
     def clean_output_line(self, line):
-        data = {}
-        data["UPRN"] = line["UPRN"]
-        data["address"] = self.clean_address(line)
-        if line["ADDRESSBASE_POSTAL"] == "D":
-            data["postcode"] = line["POSTCODE"]
+        if line[ADDRESSBASE_POSTAL] == "D":
+            postcode = line[POSTCODE]
         else:
-            data["postcode"] = line["POSTCODE_LOCATOR"]
-        data["location"] = "SRID=4326;POINT({} {})".format(
-            line["LONGITUDE"], line["LATITUDE"]
+            postcode = line[POSTCODE_LOCATOR]
+        return (
+            line[UPRN],
+            self.clean_address(line),
+            postcode,
+            "SRID=4326;POINT({} {})".format(line[LONGITUDE], line[LATITUDE]),
+            line[ADDRESSBASE_POSTAL],
         )
-        data["addressbase_postal"] = line["ADDRESSBASE_POSTAL"]
-        return data
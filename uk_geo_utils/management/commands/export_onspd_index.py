@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from uk_geo_utils.helpers import get_onspd_model
+from uk_geo_utils.onspd_store import (
+    OnspdIndex,
+    db_column_widths,
+    db_rows,
+    default_columns,
+)
+
+
+class Command(BaseCommand):
+    """
+    Export the live postcodes in the ONSPD table to a memory-mappable
+    index file for uk_geo_utils.onspd_store.OnspdIndex:
+        python manage.py export_onspd_index /path/to/onspd.idx --columns lad25cd ctry25cd
+    """
+
+    help = "Exports the live ONSPD postcodes to a binary index file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path to write the index file to")
+        parser.add_argument(
+            "--columns",
+            nargs="+",
+            help="ONSPD fields to include (defaults to all of the code fields)",
+        )
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        model = get_onspd_model()
+        columns = options.get("columns") or default_columns(model)
+        using = options.get("database", DEFAULT_DB_ALIAS)
+        count = OnspdIndex.write(
+            options["path"],
+            db_rows(columns, model, using, ordered=True),
+            columns,
+            db_column_widths(columns, model, using),
+        )
+        self.stdout.write(f"Wrote {count} postcodes to {options['path']}")
@@ -0,0 +1,143 @@
+import csv
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from uk_geo_utils.base_importer import CSVStream
+from uk_geo_utils.helpers import clear_table_populated_cache, get_address_model
+from uk_geo_utils.management.commands import clean_addressbase_plus
+from uk_geo_utils.management.commands.clean_addressbase_plus import (
+    ADDRESSBASE_POSTAL,
+    COUNTRY,
+    FIELD,
+    UPRN,
+)
+
+CHANGE_TYPE = FIELD["CHANGE_TYPE"]
+
+
+class Command(BaseCommand):
+    """
+    Apply AddressBase Plus Change-Only Update (COU) files to the Address
+    table, instead of reloading the whole table:
+        python manage.py import_addressbase_cou --data-path /path/to/cou
+    """
+
+    help = (
+        "Applies the inserts, updates and deletes in AddressBase Plus "
+        "Change-Only Update CSVs to the Address model"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--data-path",
+            required=True,
+            help="The path to the folder containing the AddressBase Plus COU CSVs",
+        )
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        self.table_name = get_address_model()._meta.db_table
+        self.staging_table_name = f"{self.table_name}_cou_staging"
+        self.cleaner = clean_addressbase_plus.Command()
+        self.cleaner.stdout = self.stdout
+
+        files = self.cleaner.get_files(os.path.abspath(options["data_path"]))
+
+        db_name = options["database"]
+        with (
+            transaction.atomic(using=db_name),
+            connections[db_name].cursor() as cursor,
+        ):
+            self.create_staging_table(cursor)
+            self.stdout.write("importing changes..")
+            cursor.copy_expert(
+                """
+                COPY %s (
+                seq, change_type, uprn, address, postcode, location,
+                addressbase_postal)
+                FROM STDIN (FORMAT CSV, DELIMITER ',', quote '"');
+            """
+                % (self.staging_table_name),
+                CSVStream(self.get_changes(files)),
+            )
+            self.apply_changes(cursor)
+
+        clear_table_populated_cache(self.table_name)
+        self.stdout.write("...done")
+
+    def create_staging_table(self, cursor):
+        # Dropped at the end of the transaction. If we're inside an outer
+        # transaction, it may still exist from an earlier import. Schema
+        # qualified, so we never drop a permanent table of the same name.
+        cursor.execute(
+            f"DROP TABLE IF EXISTS pg_temp.{self.staging_table_name};"
+        )
+        cursor.execute(f"""
+            CREATE TEMPORARY TABLE {self.staging_table_name} ON COMMIT DROP AS
+            SELECT
+                0::bigint AS seq, ''::varchar(1) AS change_type,
+                uprn, address, postcode, location, addressbase_postal
+            FROM {self.table_name} LIMIT 0;
+        """)
+
+    def get_changes(self, files):
+        """
+        Generate a row for each change in files, numbered in the order they
+        appear so that we can apply the last change to each UPRN
+        """
+        seq = 0
+        for csv_path in files:
+            self.stdout.write(csv_path)
+            with open(csv_path) as csv_file:
+                for line in csv.reader(csv_file):
+                    if not line:
+                        continue
+                    seq += 1
+                    if (
+                        line[CHANGE_TYPE] == "D"
+                        or line[ADDRESSBASE_POSTAL] == "N"
+                        or line[COUNTRY] not in ("E", "W", "S", "N")
+                    ):
+                        # Either deleted, or changed into a record that
+                        # clean_addressbase_plus would have filtered out
+                        yield (seq, "D", line[UPRN], None, None, None, None)
+                    else:
+                        yield (
+                            seq,
+                            line[CHANGE_TYPE],
+                            *self.cleaner.clean_output_line(line),
+                        )
+
+    def apply_changes(self, cursor):
+        latest_table_name = f"{self.staging_table_name}_latest"
+        cursor.execute(f"DROP TABLE IF EXISTS pg_temp.{latest_table_name};")
+        cursor.execute(f"""
+            CREATE TEMPORARY TABLE {latest_table_name} ON COMMIT DROP AS
+            SELECT DISTINCT ON (uprn) *
+            FROM {self.staging_table_name}
+            ORDER BY uprn, seq DESC;
+        """)
+
+        cursor.execute(f"""
+            DELETE FROM {self.table_name} AS a
+            USING {latest_table_name} AS c
+            WHERE a.uprn = c.uprn AND c.change_type = 'D';
+        """)
+        self.stdout.write(f"Deleted {cursor.rowcount} addresses")
+
+        cursor.execute(f"""
+            INSERT INTO {self.table_name} (
+                uprn, address, postcode, location, addressbase_postal
+            )
+            SELECT uprn, address, postcode, location, addressbase_postal
+            FROM {latest_table_name}
+            WHERE change_type != 'D'
+            ON CONFLICT (uprn) DO UPDATE SET
+                address = EXCLUDED.address,
+                postcode = EXCLUDED.postcode,
+                location = EXCLUDED.location,
+                addressbase_postal = EXCLUDED.addressbase_postal;
+        """)
+        self.stdout.write(f"Inserted or updated {cursor.rowcount} addresses")
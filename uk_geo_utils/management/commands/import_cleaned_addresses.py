@@ -1,7 +1,16 @@
 import os
 
-from uk_geo_utils.base_importer import BaseImporter
+from uk_geo_utils.base_importer import BaseImporter, CSVStream
 from uk_geo_utils.helpers import get_address_model
+from uk_geo_utils.management.commands import (
+    clean_addressbase_plus,
+    clean_addressbase_standard,
+)
+
+CLEANERS = {
+    "plus": clean_addressbase_plus.Command,
+    "standard": clean_addressbase_standard.Command,
+}
 
 
 class Command(BaseImporter):
@@ -11,11 +20,40 @@ class Command(BaseImporter):
         "Data in related tables will need to be imported/rebuilt seperately"
     )
 
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--clean",
+            choices=sorted(CLEANERS),
+            help=(
+                "Clean the raw AddressBase Plus/Standard CSVs in the data path "
+                "while importing them, instead of importing "
+                "addressbase_cleaned.csv"
+            ),
+        )
+
     def get_table_name(self):
         return get_address_model()._meta.db_table
 
+    def handle(self, *args, **options):
+        self.clean = options.get("clean")
+        super().handle(*args, **options)
+
     def import_data_to_temp_table(self):
-        self.import_addressbase(self.temp_table_name)
+        if self.clean:
+            self.import_raw_addressbase(self.temp_table_name)
+        else:
+            self.import_addressbase(self.temp_table_name)
+
+    def copy_addresses(self, table_name, fp):
+        self.cursor.copy_expert(
+            """
+            COPY %s (UPRN,address,postcode,location,addressbase_postal)
+            FROM STDIN (FORMAT CSV, DELIMITER ',', quote '"');
+        """
+            % (table_name),
+            fp,
+        )
 
     def import_addressbase(self, table_name):
         cleaned_file_path = os.path.abspath(
@@ -24,13 +62,21 @@ class Command(BaseImporter):
 
         with open(cleaned_file_path, "r") as fp:
             self.stdout.write("importing from %s.." % (cleaned_file_path))
-            self.cursor.copy_expert(
-                """
-                COPY %s (UPRN,address,postcode,location,addressbase_postal)
-                FROM STDIN (FORMAT CSV, DELIMITER ',', quote '"');
-            """
-                % (table_name),
-                fp,
-            )
+            self.copy_addresses(table_name, fp)
+
+        self.stdout.write("...done")
+
+    def import_raw_addressbase(self, table_name):
+        # Clean the raw files and feed the rows straight into COPY,
+        # without writing addressbase_cleaned.csv to disk
+        cleaner = CLEANERS[self.clean]()
+        cleaner.stdout = self.stdout
+        files = cleaner.get_files(os.path.abspath(self.data_path))
+
+        self.stdout.write("cleaning and importing from %s.." % (self.data_path))
+        self.copy_addresses(
+            table_name,
+            CSVStream(cleaner.clean_files(files)),
+        )
 
         self.stdout.write("...done")
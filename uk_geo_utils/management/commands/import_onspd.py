@@ -1,10 +1,22 @@
-import glob
-import os
-
 from django.core.management import CommandError
+from django.db import connections, transaction
 
 from uk_geo_utils.base_importer import BaseImporter
-from uk_geo_utils.helpers import get_onspd_model
+from uk_geo_utils.helpers import clear_table_populated_cache, get_onspd_model
+
+
+def location_sql(alias):
+    # turn text lng/lat into a Point() field
+    return f"""CASE
+        WHEN ({alias}."long"='0.000000' AND {alias}.lat='99.999999')
+        THEN NULL
+        ELSE ST_SetSRID(
+            ST_MakePoint(
+                {alias}."long"::double precision, {alias}.lat::double precision
+            ),
+            4326
+        )
+    END"""
 
 
 class Command(BaseImporter):
@@ -19,6 +31,18 @@ class Command(BaseImporter):
         super().__init__(*args, **kwargs)
         self.derived_fields = ["location"]
 
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        self.add_data_file_arguments(parser)
+        parser.add_argument(
+            "--delta",
+            action="store_true",
+            help=(
+                "Only insert, update and delete the postcodes which have "
+                "changed, instead of replacing the whole table"
+            ),
+        )
+
     def get_table_name(self):
         return get_onspd_model()._meta.db_table
 
@@ -27,7 +51,7 @@ class Command(BaseImporter):
 
     def check_header(self, f):
         self.stdout.write(f"checking header of {f}")
-        with open(f, "r") as fp:
+        with self.open_data_file(f) as fp:
             # get field names from file
             header_row = fp.readline()
             file_header = sorted([f.strip() for f in header_row.split(",")])
@@ -68,42 +92,222 @@ class Command(BaseImporter):
             )
             raise CommandError("\n".join(error_msg))
 
-    def import_onspd(self, table_name):
-        glob_str = os.path.join(self.data_path, "*.csv")
-        files = glob.glob(glob_str)
+    def check_headers(self, files):
+        # Validate each distinct header once, before we start importing,
+        # so we don't find a problem part way through
+        headers = {}
+        for f in files:
+            with self.open_data_file(f) as fp:
+                header_row = fp.readline()
+            if header_row not in headers.values():
+                self.check_header(f)
+            headers[f] = header_row
+        return headers
+
+    def copy_file(self, cursor, table_name, f, header):
+        self.stdout.write(f"Importing {f}")
+        with self.open_data_file(f) as fp:
+            cursor.copy_expert(
+                """
+                COPY %s (
+                %s
+                ) FROM STDIN (FORMAT CSV, DELIMITER ',', quote '"', HEADER MATCH);
+            """
+                % (table_name, header),
+                fp,
+            )
+
+    def get_staging_table_name(self):
+        return f"{self.temp_table_name}_staging"
+
+    def create_staging_table(self, table_name):
+        # The CSVs contain text lat/long but no location, so COPY them into
+        # an unlogged staging table without the derived fields and build
+        # location as we insert into the temp table, rather than rewriting
+        # every row of the temp table with an UPDATE afterwards
+        staging_table_name = self.get_staging_table_name()
+        self.cursor.execute(f"DROP TABLE IF EXISTS {staging_table_name};")
+        self.cursor.execute(
+            f"CREATE UNLOGGED TABLE {staging_table_name} "
+            f"AS SELECT * FROM {table_name} LIMIT 0;"
+        )
+        for field in self.derived_fields:
+            self.cursor.execute(
+                f"ALTER TABLE {staging_table_name} DROP COLUMN {field};"
+            )
+        return staging_table_name
+
+    def get_copied_columns(self):
+        return [
+            field.column
+            for field in get_onspd_model()._meta.concrete_fields
+            if field.name not in self.derived_fields
+        ]
+
+    def load_staging_table(self, table_name):
+        files = self.get_data_files("*.csv")
         if not files:
             raise FileNotFoundError(
-                "No CSV files found in %s" % (self.data_path)
+                "No CSV files found in %s" % (self.data_path or "Data/")
             )
 
+        headers = self.check_headers(files)
+        staging_table_name = self.create_staging_table(table_name)
+
         self.stdout.write("importing from files..")
-        for f in files:
-            header = self.check_header(f)
-            self.stdout.write(f"Importing {f}")
-            with open(f, "r") as fp:
-                self.cursor.copy_expert(
-                    """
-                    COPY %s (
-                    %s
-                    ) FROM STDIN (FORMAT CSV, DELIMITER ',', quote '"', HEADER MATCH);
-                """
-                    % (table_name, header),
-                    fp,
-                )
+        self.copy_data_files(
+            files,
+            lambda cursor, f: self.copy_file(
+                cursor, staging_table_name, f, headers[f]
+            ),
+        )
+        return staging_table_name
+
+    def import_onspd(self, table_name):
+        staging_table_name = self.load_staging_table(table_name)
 
-        # turn text lng/lat into a Point() field
+        # derive location as we copy the rows over
+        columns = self.row_sql()
         self.cursor.execute(
-            """
-            UPDATE %s SET location=CASE
-                WHEN ("long"='0.000000' AND lat='99.999999')
-                THEN NULL
-                ELSE ST_GeomFromText('POINT(' || "long" || ' ' || lat || ')',4326)
-            END
+            f"""
+            INSERT INTO {table_name} ({columns}, location)
+            SELECT {columns}, {location_sql("n")}
+            FROM {staging_table_name} AS n
+        """
+        )
+        self.cursor.execute(f"DROP TABLE {staging_table_name};")
+
+        self.stdout.write("...done")
+
+    def get_delta_counts(self, staging_table_name):
         """
-            % (table_name)
+        Count the inserted, changed, newly terminated and removed postcodes
+        in staging_table_name compared to the live table, and the number of
+        changed postcodes where each column changed
+        """
+        pk = get_onspd_model()._meta.pk.column
+        columns = self.get_copied_columns()
+        column_counts = ",\n".join(
+            f'count(*) FILTER (WHERE o."{pk}" IS NOT NULL '
+            f'AND n."{column}" IS DISTINCT FROM o."{column}")'
+            for column in columns
+        )
+        self.cursor.execute(f"""
+            SELECT
+                count(*) FILTER (WHERE o."{pk}" IS NULL),
+                count(*) FILTER (WHERE o."{pk}" IS NOT NULL
+                    AND ({self.row_sql("n")}) IS DISTINCT FROM ({self.row_sql("o")})),
+                count(*) FILTER (WHERE o.doterm = '' AND n.doterm != ''),
+                {column_counts}
+            FROM {staging_table_name} AS n
+            LEFT JOIN {self.table_name} AS o ON o."{pk}" = n."{pk}"
+        """)
+        inserted, changed, terminated, *changed_columns = self.cursor.fetchone()
+
+        self.cursor.execute(f"""
+            SELECT count(*) FROM {self.table_name} AS o
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {staging_table_name} AS n
+                WHERE n."{pk}" = o."{pk}"
+            )
+        """)
+        removed = self.cursor.fetchone()[0]
+
+        return {
+            "inserted": inserted,
+            "changed": changed,
+            "terminated": terminated,
+            "removed": removed,
+            "columns": {
+                column: count
+                for column, count in zip(columns, changed_columns)
+                if count
+            },
+        }
+
+    def row_sql(self, alias=None):
+        prefix = f"{alias}." if alias else ""
+        return ", ".join(
+            f'{prefix}"{column}"' for column in self.get_copied_columns()
         )
 
+    def apply_delta(self, staging_table_name):
+        pk = get_onspd_model()._meta.pk.column
+        columns = self.get_copied_columns()
+
+        self.cursor.execute(f"""
+            DELETE FROM {self.table_name} AS o
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {staging_table_name} AS n
+                WHERE n."{pk}" = o."{pk}"
+            )
+        """)
+
+        assignments = ", ".join(
+            f'"{column}" = n."{column}"' for column in columns if column != pk
+        )
+        self.cursor.execute(f"""
+            UPDATE {self.table_name} AS o
+            SET {assignments}, location = {location_sql("n")}
+            FROM {staging_table_name} AS n
+            WHERE o."{pk}" = n."{pk}"
+                AND ({self.row_sql("n")}) IS DISTINCT FROM ({self.row_sql("o")})
+        """)
+
+        self.cursor.execute(f"""
+            INSERT INTO {self.table_name} ({self.row_sql()}, location)
+            SELECT {self.row_sql("n")}, {location_sql("n")}
+            FROM {staging_table_name} AS n
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {self.table_name} AS o
+                WHERE o."{pk}" = n."{pk}"
+            )
+        """)
+
+    def import_delta(self, options):
+        db_name = options["database"]
+        self.database = db_name
+        self.parallel = options.get("parallel", 1)
+        self.connection = connections[db_name]
+        self.cursor = self.connection.cursor()
+        self.get_data_path(options)
+
+        try:
+            staging_table_name = self.load_staging_table(self.table_name)
+
+            self.stdout.write("comparing with existing data..")
+            self.delta_counts = self.get_delta_counts(staging_table_name)
+            self.report_delta(self.delta_counts)
+
+            with transaction.atomic(using=db_name):
+                self.apply_delta(staging_table_name)
+            clear_table_populated_cache(self.table_name)
+        finally:
+            self.cursor.execute(
+                f"DROP TABLE IF EXISTS {self.get_staging_table_name()};"
+            )
+            self.file_cleanup()
+
         self.stdout.write("...done")
 
+    def report_delta(self, counts):
+        self.stdout.write(
+            f"Inserted: {counts['inserted']}, "
+            f"changed: {counts['changed']} "
+            f"({counts['terminated']} newly terminated), "
+            f"removed: {counts['removed']}"
+        )
+        for column, count in counts["columns"].items():
+            self.stdout.write(f"  {column}: {count} changed")
+
+    def db_cleanup(self):
+        super().db_cleanup()
+        self.cursor.execute(
+            f"DROP TABLE IF EXISTS {self.get_staging_table_name()};"
+        )
+
     def handle(self, **options):
-        super().handle(**options)
+        if options.get("delta"):
+            self.import_delta(options)
+        else:
+            super().handle(**options)
@@ -1,67 +1,84 @@
-import glob
-import os
-
-from django.core.management.base import BaseCommand
-from django.db import connection, transaction
-
+from uk_geo_utils.base_importer import BaseImporter
 from uk_geo_utils.helpers import get_onsud_model
 
 
-class Command(BaseCommand):
+class Command(BaseImporter):
     """
     To import ONSUD, grab the latest release:
     http://ons.maps.arcgis.com/home/search.html?q=ONS%20Address%20Directory&t=content
     and run
-    python manage.py import_onsud /path/to/data
+    python manage.py import_onsud --data-path /path/to/data
     """
 
     def add_arguments(self, parser):
-        parser.add_argument(
-            "path", help="Path to the directory containing the ONSUD CSVs"
-        )
+        super().add_arguments(parser)
+        self.add_data_file_arguments(parser)
         parser.add_argument(
             "-t",
             "--transaction",
-            help="Run the import in a transaction",
             action="store_true",
-            default=False,
-            dest="transaction",
+            help=(
+                "Deprecated, has no effect. The new data always replaces the "
+                "old data in one transaction"
+            ),
         )
 
-    def handle(self, *args, **kwargs):
-        self.table_name = get_onsud_model()._meta.db_table
-        self.path = kwargs["path"]
-        if kwargs["transaction"]:
-            with transaction.atomic():
-                self.import_onsud()
-        else:
-            self.import_onsud()
+    def add_source_arguments(self, group):
+        super().add_source_arguments(group)
+        group.add_argument(
+            "path",
+            nargs="?",
+            help="Deprecated, use --data-path instead",
+        )
 
-    def import_onsud(self):
-        self.table_name = get_onsud_model()._meta.db_table
+    def handle(self, *args, **options):
+        if options.get("path"):
+            self.stdout.write(
+                self.style.WARNING(
+                    "Passing the path to import_onsud as a positional argument "
+                    "is deprecated, use --data-path instead"
+                )
+            )
+            options["data_path"] = options["path"]
+        if options.get("transaction"):
+            self.stdout.write(
+                self.style.WARNING(
+                    "--transaction is deprecated and has no effect. The new "
+                    "data always replaces the old data in one transaction"
+                )
+            )
+        super().handle(*args, **options)
 
-        glob_str = os.path.join(self.path, "*.csv")
-        files = glob.glob(glob_str)
-        if not files:
-            raise FileNotFoundError("No CSV files found in %s" % (self.path))
+    def get_table_name(self):
+        return get_onsud_model()._meta.db_table
 
-        cursor = connection.cursor()
-        self.stdout.write("clearing existing data..")
-        cursor.execute("TRUNCATE TABLE %s;" % (self.table_name))
+    def import_data_to_temp_table(self):
+        self.import_onsud(self.temp_table_name)
 
-        self.stdout.write("importing from files..")
-        for f in files:
-            self.stdout.write(f)
-            with open(f, "r") as fp:
-                cursor.copy_expert(
-                    """
-                    COPY %s (
-                    uprn, cty, ced, lad, ward, parish, hlthau, ctry,
-                    rgn, pcon, eer, ttwa, nuts, park, oa11, lsoa11, msoa11,
-                    wz11, ccg, bua11, buasd11, ruc11, oac11, lep1, lep2, pfa, imd)
-                    FROM STDIN (FORMAT CSV, DELIMITER ',', QUOTE '"', HEADER);
+    def copy_file(self, cursor, table_name, f):
+        self.stdout.write(f"Importing {f}")
+        with self.open_data_file(f) as fp:
+            cursor.copy_expert(
                 """
-                    % (self.table_name),
-                    fp,
-                )
+                COPY %s (
+                uprn, cty, ced, lad, ward, parish, hlthau, ctry,
+                rgn, pcon, eer, ttwa, nuts, park, oa11, lsoa11, msoa11,
+                wz11, ccg, bua11, buasd11, ruc11, oac11, lep1, lep2, pfa, imd)
+                FROM STDIN (FORMAT CSV, DELIMITER ',', QUOTE '"', HEADER);
+            """
+                % (table_name),
+                fp,
+            )
+
+    def import_onsud(self, table_name):
+        files = self.get_data_files("*.csv")
+        if not files:
+            raise FileNotFoundError(
+                "No CSV files found in %s" % (self.data_path or "Data/")
+            )
+
+        self.stdout.write("importing from files..")
+        self.copy_data_files(
+            files, lambda cursor, f: self.copy_file(cursor, table_name, f)
+        )
         self.stdout.write("...done")
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        (
+            "uk_geo_utils",
+            "0015_alter_onspd_educ23cd_alter_onspd_hlth19cd_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("table_name", models.CharField(max_length=255)),
+                ("phase", models.CharField(max_length=255)),
+                ("source", models.CharField(max_length=64)),
+                ("temp_table_oid", models.BigIntegerField(null=True)),
+                ("completed", models.DateTimeField()),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("table_name", "phase"),
+                        name="uk_geo_utils_import_checkpoint_unique_phase",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.contrib.gis.db import models
+from django.contrib.gis.db.models.functions import Centroid
+from django.contrib.gis.geos import MultiPoint
 
 try:
     from django.contrib.gis.db.models.manager import GeoManager
@@ -8,10 +10,16 @@ except ImportError:
 
 class CachedGetMixin:
     def get_cached(self, pk):
-        for record in self:
-            if record.pk == pk:
-                return record
-        raise self.model.DoesNotExist()
+        # Build a pk -> record index the first time we're called so that
+        # repeated lookups on the same (evaluated) queryset are O(1)
+        index = getattr(self, "_cached_index", None)
+        if index is None:
+            index = {record.pk: record for record in self}
+            self._cached_index = index
+        try:
+            return index[pk]
+        except KeyError:
+            raise self.model.DoesNotExist()
 
 
 class AddressQuerySet(models.QuerySet, CachedGetMixin):
@@ -23,12 +31,20 @@ class AddressQuerySet(models.QuerySet, CachedGetMixin):
         if len(self) == 1:
             return self[0].location
 
-        base_point = self[0].location
-        poly = base_point.union(self[1].location)
-        for m in self:
-            poly = poly.union(m.location)
+        # This is the centroid of the union of all the points. Building a
+        # MultiPoint of the distinct points gives GEOS the same input
+        # without unioning them one at a time.
+        points = {m.location.coords: m.location for m in self}
+        return MultiPoint(*points.values(), srid=self[0].location.srid).centroid
 
-        return poly.centroid
+    def db_centroid(self):
+        """
+        Calculate the centroid in the database, without fetching the
+        addresses. Equivalent to .centroid, but doesn't use the result cache.
+        """
+        return self.aggregate(centroid=Centroid(models.Union("location")))[
+            "centroid"
+        ]
 
 
 class AbstractAddressManager(GeoManager):
@@ -385,3 +401,26 @@ class AbstractOnspd(models.Model):
 
 class Onspd(AbstractOnspd):
     pass
+
+
+class ImportCheckpoint(models.Model):
+    """
+    A phase of an import that has finished, recorded by BaseImporter
+    commands run with --resume
+    """
+
+    table_name = models.CharField(max_length=255)
+    phase = models.CharField(max_length=255)
+    # hash of the data being imported
+    source = models.CharField(max_length=64)
+    # oid of the temp table the phase was run against
+    temp_table_oid = models.BigIntegerField(null=True)
+    completed = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["table_name", "phase"],
+                name="uk_geo_utils_import_checkpoint_unique_phase",
+            )
+        ]
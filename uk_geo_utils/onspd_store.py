@@ -0,0 +1,347 @@
+import bisect
+import contextlib
+import csv
+import json
+import math
+import mmap
+import os
+import struct
+from array import array
+
+from django.contrib.gis.geos import Point
+from django.db import DEFAULT_DB_ALIAS, models
+from django.db.models import Max
+from django.db.models.functions import Collate, Length
+
+from uk_geo_utils.helpers import get_onspd_model
+
+# Fields which aren't stored as codes, because every postcode has its own
+# value (or, for lat/long, because they're stored as numbers)
+NON_CODE_FIELDS = ["pcd7", "pcd8", "pcds", "lat", "long"]
+
+
+class _FieldName:
+    # Stands in for a model instance when calling an alias property
+    # (e.g. Onspd.lad), to find out which field it returns
+    def __getattr__(self, name):
+        return name
+
+
+def default_columns(model):
+    return [
+        field.name
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.CharField)
+        and field.name not in NON_CODE_FIELDS
+    ]
+
+
+def resolve_column(model, code_type, columns):
+    """
+    Map code_type to one of columns, following the aliases defined
+    on the ONSPD model (e.g. lad -> lad25cd)
+    """
+    if code_type in columns:
+        return code_type
+    alias = getattr(model, code_type, None)
+    if not isinstance(alias, property):
+        raise AttributeError(
+            f"{code_type} is not a field or alias stored in the ONSPD store"
+        )
+    return resolve_column(model, alias.fget(_FieldName()), columns)
+
+
+def db_rows(columns, model, using=DEFAULT_DB_ALIAS, ordered=False):
+    """
+    Generate the live postcodes in the ONSPD table as dicts. If ordered is
+    True, they are sorted by the bytes of pcds, as OnspdIndex.write() needs.
+    """
+    fields = ["pcds", "lat", "long", *columns]
+    queryset = model.objects.using(using).filter(doterm="").values_list(*fields)
+    if ordered:
+        queryset = queryset.order_by(Collate("pcds", "C"))
+    for row in queryset.iterator(chunk_size=10000):
+        yield dict(zip(fields, row))
+
+
+def db_column_widths(columns, model, using=DEFAULT_DB_ALIAS):
+    """Length of the longest live value in each column, for OnspdIndex.write()"""
+    lengths = (
+        model.objects.using(using)
+        .filter(doterm="")
+        .aggregate(
+            **{
+                f"width_{i}": Max(Length(column))
+                for i, column in enumerate(columns)
+            }
+        )
+    )
+    return [max(lengths[f"width_{i}"] or 0, 1) for i in range(len(columns))]
+
+
+def csv_rows(paths):
+    """Generate the live postcodes in the ONSPD CSVs as dicts"""
+    for path in paths:
+        with open(path) as f:
+            for row in csv.DictReader(f):
+                if row["doterm"] == "":
+                    yield row
+
+
+def parse_location(row):
+    # returns (lat, long), with NaNs for the "no grid reference" sentinel
+    if row["long"] == "0.000000" and row["lat"] == "99.999999":
+        return math.nan, math.nan
+    return float(row["lat"]), float(row["long"])
+
+
+class OnspdStore:
+    """
+    Read-only, in-memory copy of the live (not terminated) postcodes in
+    ONSPD, for looking up centroids and codes without a database query.
+
+    Each column is stored as an array of indexes into a list of the distinct
+    values in that column, so codes shared by many postcodes are only
+    stored once. lat/long are stored as arrays of floats.
+    """
+
+    def __init__(self, columns=None, model=None):
+        self.model = model or get_onspd_model()
+        if columns is None:
+            columns = default_columns(self.model)
+        self.columns = list(columns)
+
+        self._index = {}
+        self._lat = array("d")
+        self._long = array("d")
+        self._codes = {column: array("I") for column in self.columns}
+        self._values = {column: [] for column in self.columns}
+        self._value_index = {column: {} for column in self.columns}
+        self._aliases = {}
+
+    @classmethod
+    def from_db(cls, columns=None, model=None, using=DEFAULT_DB_ALIAS):
+        store = cls(columns=columns, model=model)
+        for row in db_rows(store.columns, store.model, using):
+            store.add(row)
+        return store
+
+    @classmethod
+    def from_csv(cls, paths, columns=None, model=None):
+        store = cls(columns=columns, model=model)
+        for row in csv_rows(paths):
+            store.add(row)
+        return store
+
+    def add(self, row):
+        """
+        Add a postcode to the store. row is a dict of ONSPD field names
+        to values, as they appear in the ONSPD CSVs
+        """
+        self._index[row["pcds"]] = len(self._lat)
+        lat, long = parse_location(row)
+        self._lat.append(lat)
+        self._long.append(long)
+
+        for column in self.columns:
+            value = row[column]
+            value_index = self._value_index[column]
+            if value not in value_index:
+                value_index[value] = len(self._values[column])
+                self._values[column].append(value)
+            self._codes[column].append(value_index[value])
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, postcode):
+        return postcode in self._index
+
+    def get_row(self, postcode):
+        """
+        Return the row number of postcode (in the same format as the pcds
+        field, e.g. 'SW1A 1AA'). Raises the ONSPD model's DoesNotExist
+        exception if the postcode isn't in the store.
+        """
+        try:
+            return self._index[postcode]
+        except KeyError:
+            raise self.model.DoesNotExist(
+                f"{postcode} not found in ONSPD store"
+            ) from None
+
+    def get_centroid(self, row):
+        lat = self._lat[row]
+        if math.isnan(lat):
+            return None
+        return Point(self._long[row], lat, srid=4326)
+
+    def get_code(self, row, code_type):
+        if code_type not in self._aliases:
+            self._aliases[code_type] = resolve_column(
+                self.model, code_type, self.columns
+            )
+        column = self._aliases[code_type]
+        return self._values[column][self._codes[column][row]]
+
+
+class _Keys:
+    # Sequence of the postcodes in an OnspdIndex, for bisect
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, row):
+        return self.index.get_key(row)
+
+
+class OnspdIndex:
+    """
+    Read-only ONSPD lookups from a file written by OnspdIndex.write()
+    (or the export_onspd_index command). The file is memory mapped, so
+    processes on the same host share one copy of it in the page cache.
+    It has the same interface as OnspdStore, so it can be passed to
+    OnspdStoreGeocoder.
+
+    The file is a header followed by fixed-width records sorted by
+    postcode: the postcode, lat and long as doubles, then each column
+    padded with nulls to the width of its longest value.
+    """
+
+    MAGIC = b"UKGEOPC1"
+    POSTCODE_WIDTH = 8
+
+    def __init__(self, path, model=None):
+        self.model = model or get_onspd_model()
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[: len(self.MAGIC)] != self.MAGIC:
+            raise ValueError(f"{path} is not an ONSPD index file")
+        (header_size,) = struct.unpack_from("<I", self._mmap, len(self.MAGIC))
+        header_start = len(self.MAGIC) + 4
+        header = json.loads(
+            self._mmap[header_start : header_start + header_size]
+        )
+        self._data_start = header_start + header_size
+
+        self.columns = header["columns"]
+        self._struct = self.get_struct(header["widths"])
+        self._count, remainder = divmod(
+            len(self._mmap) - self._data_start, self._struct.size
+        )
+        if remainder:
+            raise ValueError(f"{path} is truncated")
+        self._code_offsets = {}
+        offset = self.POSTCODE_WIDTH + 16
+        for column, width in zip(self.columns, header["widths"]):
+            self._code_offsets[column] = (offset, offset + width)
+            offset += width
+        self._keys = _Keys(self)
+        self._aliases = {}
+
+    @classmethod
+    def get_struct(cls, widths):
+        return struct.Struct(
+            f"<{cls.POSTCODE_WIDTH}sdd" + "".join(f"{w}s" for w in widths)
+        )
+
+    @classmethod
+    def write(cls, path, rows, columns, widths):
+        """
+        Write rows (dicts like those passed to OnspdStore.add()) to an
+        index file at path. Rows are written as they are generated, so they
+        must already be sorted by postcode (e.g. from db_rows() with
+        ordered=True). widths is the length of the longest value in each
+        column (e.g. from db_column_widths()).
+
+        The file is written to a temporary file and then moved into place,
+        so processes which already have the old file open can carry on
+        using it.
+        """
+        record_struct = cls.get_struct(widths)
+        header = json.dumps({"columns": columns, "widths": widths}).encode()
+        tmp_path = f"{path}.tmp"
+        count = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(cls.MAGIC)
+                f.write(struct.pack("<I", len(header)))
+                f.write(header)
+                last_key = b""
+                for row in rows:
+                    key = row["pcds"].encode("ascii")
+                    if key < last_key:
+                        raise ValueError(
+                            f"{row['pcds']} is out of order, rows must be "
+                            "sorted by postcode"
+                        )
+                    codes = [row[column].encode("ascii") for column in columns]
+                    for column, code, width in zip(columns, codes, widths):
+                        if len(code) > width:
+                            raise ValueError(
+                                f"{column} value {code.decode()} is longer "
+                                f"than its width ({width})"
+                            )
+                    lat, long = parse_location(row)
+                    f.write(record_struct.pack(key, lat, long, *codes))
+                    last_key = key
+                    count += 1
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+        return count
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, postcode):
+        try:
+            self.get_row(postcode)
+        except self.model.DoesNotExist:
+            return False
+        return True
+
+    def _offset(self, row):
+        return self._data_start + row * self._struct.size
+
+    def get_key(self, row):
+        offset = self._offset(row)
+        return self._mmap[offset : offset + self.POSTCODE_WIDTH]
+
+    def get_row(self, postcode):
+        key = postcode.encode("ascii").ljust(self.POSTCODE_WIDTH, b"\0")
+        row = bisect.bisect_left(self._keys, key)
+        if row < self._count and self.get_key(row) == key:
+            return row
+        raise self.model.DoesNotExist(f"{postcode} not found in ONSPD index")
+
+    def get_centroid(self, row):
+        lat, long = struct.unpack_from(
+            "<dd", self._mmap, self._offset(row) + self.POSTCODE_WIDTH
+        )
+        if math.isnan(lat):
+            return None
+        return Point(long, lat, srid=4326)
+
+    def get_code(self, row, code_type):
+        if code_type not in self._aliases:
+            self._aliases[code_type] = resolve_column(
+                self.model, code_type, self.columns
+            )
+        start, end = self._code_offsets[self._aliases[code_type]]
+        offset = self._offset(row)
+        return self._mmap[offset + start : offset + end].rstrip(b"\0").decode()
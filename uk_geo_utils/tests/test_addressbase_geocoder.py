@@ -1,6 +1,6 @@
 from django.contrib.gis.geos import Point
 from django.core.exceptions import FieldDoesNotExist
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from uk_geo_utils.geocoders import (
     AddressBaseGeocoder,
@@ -13,8 +13,8 @@ from uk_geo_utils.geocoders import (
     get_address_model,
     get_onsud_model,
 )
-from uk_geo_utils.helpers import AddressSorter
-from uk_geo_utils.models import Address
+from uk_geo_utils.helpers import AddressSorter, clear_table_populated_cache
+from uk_geo_utils.models import Address, Onsud
 
 
 class FuzzyInt(int):
@@ -79,6 +79,15 @@ class AddressBaseGeocoderTest(TestCase):
         ):
             AddressBaseGeocoder("ZZ1 1ZZ")
 
+    def test_invalid_postcode(self):
+        """
+        Invalid postcodes are rejected without querying the database
+        """
+        with self.assertNumQueries(0), self.assertRaises(
+            get_address_model().DoesNotExist
+        ):
+            AddressBaseGeocoder("foo bar")
+
     def test_no_codes(self):
         """
         We find records for the given postcode in the AddressBase table
@@ -203,6 +212,25 @@ class AddressBaseGeocoderTest(TestCase):
             sorter = AddressSorter(addressbase._addresses)
             self.assertEqual(addressbase.addresses, sorter.natural_sort())
 
+    def test_centroid_uses_fetched_addresses(self):
+        addressbase = AddressBaseGeocoder("BB11BB")
+        with self.assertNumQueries(0):
+            centroid = addressbase.centroid
+        self.assertEqual(
+            addressbase._addresses.filter(addressbase_postal="D").centroid,
+            centroid,
+        )
+
+    def test_centroid_no_type_d(self):
+        Address.objects.filter(postcode="BB1 1BB").update(
+            addressbase_postal="L"
+        )
+        addressbase = AddressBaseGeocoder("BB11BB")
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                addressbase._addresses.centroid, addressbase.centroid
+            )
+
     def test_centroid_ignores_type_l(self):
         addressbase = AddressBaseGeocoder("BB11BB")
         before_centroid = addressbase.centroid
@@ -215,3 +243,162 @@ class AddressBaseGeocoderTest(TestCase):
         )
         after_centroid = addressbase.centroid
         self.assertEqual(before_centroid, after_centroid)
+
+
+class AddressBaseGeocoderSingleQueryTest(TestCase):
+    fixtures = [
+        "addressbase_geocoder/AA11AA.json",
+        "addressbase_geocoder/BB11BB.json",
+        "addressbase_geocoder/CC11CC.json",
+    ]
+
+    def test_no_records(self):
+        with self.assertNumQueries(3), self.assertRaises(
+            get_address_model().DoesNotExist
+        ):
+            AddressBaseGeocoder("ZZ1 1ZZ", single_query=True)
+
+    def test_no_codes(self):
+        with self.assertNumQueries(3):
+            addressbase = AddressBaseGeocoder("AA11AA", single_query=True)
+            with self.assertRaises(CodesNotFoundException):
+                addressbase.get_code("lad")
+
+    def test_valid(self):
+        with self.assertNumQueries(3):
+            addressbase = AddressBaseGeocoder("BB11BB", single_query=True)
+            self.assertEqual("B01000001", addressbase.get_code("lad"))
+            with self.assertRaises(StrictMatchException):
+                addressbase.get_code("lad", strict=True)
+            with self.assertRaises(get_onsud_model().DoesNotExist):
+                addressbase.get_code("lad", "00000006")
+            self.assertIsInstance(addressbase.get_point("00000006"), Point)
+        self.assertEqual(
+            AddressBaseGeocoder("BB11BB").addresses, addressbase.addresses
+        )
+
+    def test_get_code_by_uprn(self):
+        with self.assertNumQueries(3):
+            addressbase = AddressBaseGeocoder("CC1 1CC", single_query=True)
+            with self.assertRaises(MultipleCodesException):
+                addressbase.get_code("lad")
+            self.assertEqual("A01000001", addressbase.get_code("cty"))
+            self.assertEqual(
+                "B01000001", addressbase.get_code("lad", "00000008")
+            )
+            self.assertEqual(
+                "B01000002", addressbase.get_code("lad", "00000009")
+            )
+            with self.assertRaises(get_address_model().DoesNotExist):
+                addressbase.get_code("lad", "00000001")
+
+
+class AddressBaseGeocoderBulkTest(TestCase):
+    fixtures = [
+        "addressbase_geocoder/AA11AA.json",
+        "addressbase_geocoder/BB11BB.json",
+        "addressbase_geocoder/CC11CC.json",
+    ]
+
+    def test_bulk(self):
+        with self.assertNumQueries(3):
+            geocoders = AddressBaseGeocoder.bulk(
+                ["AA11AA", "bb1 1bb", "CC1 1CC", "ZZ1 1ZZ", "BT1 1AA"]
+            )
+            self.assertEqual(["AA11AA", "BB11BB", "CC11CC"], sorted(geocoders))
+
+            with self.assertRaises(CodesNotFoundException):
+                geocoders["AA11AA"].get_code("lad")
+            self.assertEqual("B01000001", geocoders["BB11BB"].get_code("lad"))
+            with self.assertRaises(StrictMatchException):
+                geocoders["BB11BB"].get_code("lad", strict=True)
+            with self.assertRaises(MultipleCodesException):
+                geocoders["CC11CC"].get_code("lad")
+            self.assertEqual(
+                "B01000002", geocoders["CC11CC"].get_code("lad", "00000009")
+            )
+            self.assertIsInstance(
+                geocoders["CC11CC"].get_point("00000009"), Point
+            )
+
+        for postcode, geocoder in geocoders.items():
+            single = AddressBaseGeocoder(postcode)
+            self.assertEqual(single.uprns, geocoder.uprns)
+            self.assertEqual(single.addresses, geocoder.addresses)
+            self.assertEqual(single.centroid, geocoder.centroid)
+
+    def test_bulk_invalid_postcodes(self):
+        with self.assertNumQueries(2):
+            geocoders = AddressBaseGeocoder.bulk(["foo", "BB1 1B1"])
+        self.assertEqual({}, geocoders)
+
+    def test_bulk_batches(self):
+        with self.assertNumQueries(4):
+            geocoders = AddressBaseGeocoder.bulk(
+                ["AA11AA", "BB11BB", "CC11CC"], batch_size=2
+            )
+        self.assertEqual(["AA11AA", "BB11BB", "CC11CC"], sorted(geocoders))
+
+    def test_bulk_empty_addressbase_table(self):
+        get_address_model().objects.all().delete()
+        with self.assertRaises(AddressBaseNotImportedException):
+            AddressBaseGeocoder.bulk(["AA11AA"])
+
+
+class TablePopulatedCacheTest(TestCase):
+    fixtures = ["addressbase_geocoder/BB11BB.json"]
+
+    def tearDown(self):
+        clear_table_populated_cache()
+
+    def test_no_ttl(self):
+        with self.assertNumQueries(4):
+            AddressBaseGeocoder("BB11BB")
+        with self.assertNumQueries(4):
+            AddressBaseGeocoder("BB11BB")
+
+    @override_settings(GEOCODER_TABLE_CHECK_TTL=60)
+    def test_ttl(self):
+        with self.assertNumQueries(4):
+            AddressBaseGeocoder("BB11BB")
+        # we've already checked both tables have data in
+        with self.assertNumQueries(2):
+            AddressBaseGeocoder("BB11BB")
+
+    @override_settings(GEOCODER_TABLE_CHECK_TTL=60)
+    def test_cache_cleared(self):
+        AddressBaseGeocoder("BB11BB")
+        get_address_model().objects.all().delete()
+        clear_table_populated_cache(get_address_model()._meta.db_table)
+        with self.assertRaises(AddressBaseNotImportedException):
+            AddressBaseGeocoder("BB11BB")
+
+    @override_settings(GEOCODER_TABLE_CHECK_TTL=60)
+    def test_empty_table_not_cached(self):
+        get_onsud_model().objects.all().delete()
+        with self.assertRaises(OnsudNotImportedException):
+            AddressBaseGeocoder("BB11BB")
+        get_onsud_model().objects.create(uprn="00000004", lad="B01000001")
+        self.assertEqual(
+            "B01000001", AddressBaseGeocoder("BB11BB").get_code("lad")
+        )
+
+
+class CachedGetTest(TestCase):
+    fixtures = ["addressbase_geocoder/CC11CC.json"]
+
+    def test_get_cached(self):
+        with self.assertNumQueries(2):
+            addresses = Address.objects.filter(postcode="CC1 1CC")
+            records = Onsud.objects.filter(uprn__in=["00000008", "00000009"])
+            for _ in range(3):
+                self.assertEqual(
+                    "00000008", addresses.get_cached("00000008").pk
+                )
+                self.assertEqual(
+                    "B01000002", records.get_cached("00000009").lad
+                )
+            with self.assertRaises(Address.DoesNotExist):
+                addresses.get_cached("00000001")
+            with self.assertRaises(Onsud.DoesNotExist):
+                records.get_cached("foo")
@@ -37,3 +37,31 @@ class CentroidTest(TestCase):
         # centre point of the North and South pole
         # should be *somewhere* on the equator, right
         self.assertEqual(qs.centroid.y, 0)
+
+    def test_centroid_duplicate_points(self):
+        Address.objects.create(
+            uprn="6",
+            postcode="KW15 88TF",
+            address="The Cott, Flat 2",
+            location=Address.objects.get(pk=2).location,
+            addressbase_postal="D",
+        )
+        qs = Address.objects.filter(pk__in=["1", "2", "6"])
+        self.assertEqual(0.7217038959382571, qs.centroid.x)
+        self.assertEqual(52.0970394718411853, qs.centroid.y)
+
+    def test_centroid_no_points(self):
+        self.assertIsNone(Address.objects.filter(pk="foo").centroid)
+        self.assertIsNone(Address.objects.filter(pk="foo").db_centroid())
+
+    def test_db_centroid(self):
+        for qs in [
+            Address.objects.filter(pk=1),
+            Address.objects.filter(pk__lte=2),
+            Address.objects.filter(pk__lte=3),
+        ]:
+            with self.assertNumQueries(1):
+                centroid = qs.db_centroid()
+            self.assertAlmostEqual(qs.centroid.x, centroid.x)
+            self.assertAlmostEqual(qs.centroid.y, centroid.y)
+            self.assertEqual(4326, centroid.srid)
@@ -51,6 +51,38 @@ class CleanAddressesTest(TestCase):
                     )
                 )
 
+    def test_clean_addresses_workers(self):
+        csv_path = os.path.abspath(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "../fixtures/addressbase_plus",
+            )
+        )
+        outfile = os.path.join(csv_path, "addressbase_cleaned.csv")
+
+        cmd = Command()
+        cmd.stdout = StringIO()
+        cmd.handle(ab_path=csv_path, workers=1)
+        with open(outfile, "rb") as csvfile:
+            expected = csvfile.read()
+
+        cmd = Command()
+        cmd.stdout = StringIO()
+        cmd.handle(ab_path=csv_path, workers=2)
+        with open(outfile, "rb") as csvfile:
+            self.assertEqual(expected, csvfile.read())
+
+        self.assertIn("Cleaned 9 rows", cmd.stdout.getvalue())
+        # part files have been cleaned up
+        self.assertEqual(
+            [
+                "addressbase_cleaned.csv",
+                "addressbase_test1.csv",
+                "addressbase_test2.csv",
+            ],
+            sorted(os.listdir(csv_path)),
+        )
+
     def test_clean_addresses_file_not_found(self):
         csv_path = os.path.abspath(
             os.path.join(
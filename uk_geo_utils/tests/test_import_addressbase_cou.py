@@ -0,0 +1,104 @@
+import os
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test import TestCase
+
+from uk_geo_utils.helpers import clear_table_populated_cache
+from uk_geo_utils.management.commands.import_addressbase_cou import Command
+from uk_geo_utils.models import Address
+
+
+class AddressBaseCouImportTest(TestCase):
+    def setUp(self):
+        # start with a full import of addressbase_plus
+        call_command(
+            "import_cleaned_addresses",
+            stdout=StringIO(),
+            data_path=os.path.abspath(
+                os.path.join(
+                    os.path.dirname(os.path.abspath(__file__)),
+                    "../fixtures/addressbase_plus",
+                )
+            ),
+            clean="plus",
+        )
+        self.csv_path = os.path.abspath(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "../fixtures/addressbase_plus_cou",
+            )
+        )
+
+    def tearDown(self):
+        clear_table_populated_cache()
+
+    def test_import_cou(self):
+        self.assertEqual(9, Address.objects.count())
+        old_address = Address.objects.get(uprn="10000000001").address
+
+        cmd = Command()
+        cmd.stdout = StringIO()
+        opts = {"data_path": self.csv_path, "database": DEFAULT_DB_ALIAS}
+        cmd.handle(**opts)
+
+        # 2 deleted (1 by a D change, 1 changed to type N) and 1 inserted
+        self.assertEqual(8, Address.objects.count())
+        self.assertFalse(
+            Address.objects.filter(
+                uprn__in=["10000000002", "10000000003"]
+            ).exists()
+        )
+
+        # updated
+        updated = Address.objects.get(uprn="10000000001")
+        self.assertEqual(old_address.replace("53", "55"), updated.address)
+
+        # inserted, then updated by a later change in the same file
+        inserted = Address.objects.get(uprn="10000000010")
+        self.assertEqual("B63 9ZZ", inserted.postcode)
+        self.assertIsNotNone(inserted.location)
+
+    def test_import_cou_twice(self):
+        # applying the same changes again shouldn't change anything
+        opts = {"data_path": self.csv_path, "database": DEFAULT_DB_ALIAS}
+        for _ in range(2):
+            cmd = Command()
+            cmd.stdout = StringIO()
+            cmd.handle(**opts)
+
+        self.assertEqual(8, Address.objects.count())
+
+    def test_permanent_table_with_staging_name(self):
+        # only the temporary staging tables should be dropped
+        table_name = f"{Address._meta.db_table}_cou_staging"
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE TABLE {table_name} (id int);")
+            cursor.execute(f"CREATE TABLE {table_name}_latest (id int);")
+
+        cmd = Command()
+        cmd.stdout = StringIO()
+        cmd.handle(data_path=self.csv_path, database=DEFAULT_DB_ALIAS)
+
+        self.assertEqual(8, Address.objects.count())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT to_regclass(%s), to_regclass(%s);",
+                [f"public.{table_name}", f"public.{table_name}_latest"],
+            )
+            self.assertNotIn(None, cursor.fetchone())
+
+    def test_import_cou_file_not_found(self):
+        csv_path = os.path.abspath(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "../fixtures/pathdoesnotexist",
+            )
+        )
+
+        cmd = Command()
+        cmd.stdout = StringIO()
+        opts = {"data_path": csv_path, "database": DEFAULT_DB_ALIAS}
+        with self.assertRaises(FileNotFoundError):
+            cmd.handle(**opts)
@@ -1,13 +1,16 @@
 import os
+import shutil
+import tempfile
 from io import StringIO
+from unittest.mock import patch
 
 from django.core import management
-from django.db import DEFAULT_DB_ALIAS
+from django.db import DEFAULT_DB_ALIAS, connection
 from django.test import TestCase, TransactionTestCase
 from django.utils.connection import ConnectionDoesNotExist
 
 from uk_geo_utils.management.commands.import_cleaned_addresses import Command
-from uk_geo_utils.models import Address
+from uk_geo_utils.models import Address, ImportCheckpoint
 
 
 class CleanedAddressImportTest(TestCase):
@@ -35,6 +38,45 @@ class CleanedAddressImportTest(TestCase):
         # ensure all our tasty data has been imported
         self.assertEqual(4, Address.objects.count())
 
+    def test_import_raw_addresses(self):
+        for clean in ["plus", "standard"]:
+            csv_path = os.path.abspath(
+                os.path.join(
+                    os.path.dirname(os.path.abspath(__file__)),
+                    f"../fixtures/addressbase_{clean}",
+                )
+            )
+
+            cmd = Command()
+            cmd.stdout = StringIO()
+            opts = {
+                "data_path": csv_path,
+                "database": DEFAULT_DB_ALIAS,
+                "clean": clean,
+            }
+            cmd.handle(**opts)
+
+            self.assertEqual(9, Address.objects.count())
+            self.assertFalse(Address.objects.filter(location=None).exists())
+
+    def test_import_raw_addresses_file_not_found(self):
+        csv_path = os.path.abspath(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "../fixtures/pathdoesnotexist",
+            )
+        )
+
+        cmd = Command()
+        cmd.stdout = StringIO()
+        opts = {
+            "data_path": csv_path,
+            "database": DEFAULT_DB_ALIAS,
+            "clean": "plus",
+        }
+        with self.assertRaises(FileNotFoundError):
+            cmd.handle(**opts)
+
     def test_import_cleaned_addresses_file_not_found(self):
         csv_path = os.path.abspath(
             os.path.join(
@@ -124,3 +166,268 @@ class MultiDBAddressImportTest(TransactionTestCase):
             str(context.exception),
             "The connection 'nonexistent_db' doesn't exist.",
         )
+
+
+class ResumeCleanedAddressImportTest(TestCase):
+    def setUp(self):
+        self.csv_path = os.path.abspath(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "../fixtures/cleaned_addresses",
+            )
+        )
+        self.opts = {
+            "data_path": self.csv_path,
+            "database": DEFAULT_DB_ALIAS,
+            "resume": True,
+        }
+
+    def test_resume_after_failure(self):
+        cmd = Command()
+        cmd.stdout = StringIO()
+
+        # fail after the data has been imported and the primary key added
+        with (
+            patch.object(
+                Command, "build_temp_index", side_effect=Exception("Oh no")
+            ),
+            self.assertRaises(Exception),
+        ):
+            cmd.handle(**self.opts)
+
+        self.assertEqual(0, Address.objects.count())
+        self.assertEqual({"import_data", "primary_key"}, cmd.completed_phases)
+        self.assertEqual(
+            ["import_data", "primary_key"],
+            list(
+                ImportCheckpoint.objects.filter(
+                    table_name=Address._meta.db_table
+                )
+                .order_by("phase")
+                .values_list("phase", flat=True)
+            ),
+        )
+
+        # the rerun should carry on from the last checkpoint
+        cmd = Command()
+        cmd.stdout = StringIO()
+        with patch.object(
+            Command,
+            "import_data_to_temp_table",
+            side_effect=AssertionError("data should not be imported again"),
+        ):
+            cmd.handle(**self.opts)
+
+        self.assertEqual(4, Address.objects.count())
+        self.assertEqual(set(), cmd.completed_phases)
+        self.assertFalse(cmd.temp_table_exists())
+        self.assertEqual(set(), cmd.get_completed_phases())
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def fail_after_primary_key(self, opts):
+        cmd = Command()
+        cmd.stdout = StringIO()
+        with (
+            patch.object(
+                Command, "build_temp_index", side_effect=Exception("Oh no")
+            ),
+            self.assertRaises(Exception),
+        ):
+            cmd.handle(**opts)
+        self.assertEqual({"import_data", "primary_key"}, cmd.completed_phases)
+
+    def test_resume_with_different_data(self):
+        self.fail_after_primary_key(self.opts)
+
+        # a rerun importing different data shouldn't use the temp table
+        with tempfile.TemporaryDirectory() as tmpdir:
+            shutil.copy(
+                os.path.join(self.csv_path, "addressbase_cleaned.csv"), tmpdir
+            )
+            cmd = Command()
+            cmd.stdout = StringIO()
+            with patch.object(
+                Command,
+                "import_data_to_temp_table",
+                wraps=cmd.import_data_to_temp_table,
+            ) as import_data:
+                cmd.handle(**{**self.opts, "data_path": tmpdir})
+
+        import_data.assert_called_once()
+        self.assertIn(
+            "The checkpoints were recorded while importing different data, "
+            "starting import from scratch",
+            cmd.stdout.getvalue(),
+        )
+        self.assertEqual(4, Address.objects.count())
+
+    def test_resume_temp_table_replaced(self):
+        self.fail_after_primary_key(self.opts)
+
+        # e.g. a run without --resume was killed part way through loading
+        # a new temp table
+        table_name = Address._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {table_name}_temp;")
+            cursor.execute(
+                f"CREATE TABLE {table_name}_temp "
+                f"AS SELECT * FROM {table_name} LIMIT 0;"
+            )
+
+        cmd = Command()
+        cmd.stdout = StringIO()
+        cmd.handle(**self.opts)
+
+        self.assertIn(
+            f"{table_name}_temp was not created by a --resume run of this "
+            "import, starting import from scratch",
+            cmd.stdout.getvalue(),
+        )
+        self.assertEqual(4, Address.objects.count())
+
+
+class ParallelIndexAddressImportTest(TransactionTestCase):
+    # Indexes are built over separate connections, so the temp table has to
+    # be committed before they can see it.
+    def get_index_names(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexname FROM pg_indexes WHERE tablename = %s",
+                [Address._meta.db_table],
+            )
+            return sorted(row[0] for row in cursor.fetchall())
+
+    def test_build_indexes_in_parallel(self):
+        csv_path = os.path.abspath(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "../fixtures/cleaned_addresses",
+            )
+        )
+        index_names = self.get_index_names()
+
+        cmd = Command()
+        cmd.stdout = StringIO()
+        opts = {
+            "data_path": csv_path,
+            "database": DEFAULT_DB_ALIAS,
+            "index_workers": 2,
+            "maintenance_work_mem": "64MB",
+            "max_parallel_maintenance_workers": 2,
+        }
+        cmd.handle(**opts)
+
+        self.assertEqual(4, Address.objects.count())
+        self.assertEqual(index_names, self.get_index_names())
+        self.assertIn(
+            "Setting maintenance_work_mem to 64MB", cmd.stdout.getvalue()
+        )
+
+
+class UnloggedCleanedAddressImportTest(TestCase):
+    def setUp(self):
+        self.csv_path = os.path.abspath(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "../fixtures/cleaned_addresses",
+            )
+        )
+
+    def get_relpersistence(self, table_name):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT relpersistence FROM pg_class WHERE oid = to_regclass(%s)",
+                [table_name],
+            )
+            return cursor.fetchone()[0]
+
+    def test_unlogged_load(self):
+        cmd = Command()
+        cmd.stdout = StringIO()
+        opts = {
+            "data_path": self.csv_path,
+            "database": DEFAULT_DB_ALIAS,
+            "unlogged_load": True,
+        }
+        cmd.handle(**opts)
+
+        self.assertEqual(4, Address.objects.count())
+        # the table we swapped in should be a normal logged table
+        self.assertEqual("p", self.get_relpersistence(Address._meta.db_table))
+
+    def test_unlogged_load_with_logical_slots(self):
+        opts = {
+            "data_path": self.csv_path,
+            "database": DEFAULT_DB_ALIAS,
+            "unlogged_load": True,
+        }
+        with patch.object(
+            Command, "get_logical_replication_slots", return_value=["sub"]
+        ):
+            cmd = Command()
+            cmd.stdout = StringIO()
+            with self.assertRaisesMessage(
+                Exception, "Logical replication slots found: sub"
+            ):
+                cmd.handle(**opts)
+            self.assertEqual(0, Address.objects.count())
+
+            cmd = Command()
+            cmd.stdout = StringIO()
+            cmd.handle(**opts, allow_logical_slots=True)
+            self.assertIn("won't see the imported data", cmd.stdout.getvalue())
+            self.assertEqual(4, Address.objects.count())
+
+    def test_resume_truncated_unlogged_table(self):
+        cmd = Command()
+        cmd.stdout = StringIO()
+        opts = {
+            "data_path": self.csv_path,
+            "database": DEFAULT_DB_ALIAS,
+            "unlogged_load": True,
+            "resume": True,
+        }
+
+        # simulate an unlogged temp table emptied by crash recovery
+        with (
+            patch.object(
+                Command, "add_temp_primary_key", side_effect=Exception("Oh no")
+            ),
+            self.assertRaises(Exception),
+        ):
+            cmd.handle(**opts)
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {cmd.temp_table_name}")
+
+        cmd = Command()
+        cmd.stdout = StringIO()
+        cmd.handle(**opts)
+
+        self.assertIn("starting import from scratch", cmd.stdout.getvalue())
+        self.assertEqual(4, Address.objects.count())
+
+    def test_resume_unlogged_table_without_flag(self):
+        cmd = Command()
+        cmd.stdout = StringIO()
+        opts = {
+            "data_path": self.csv_path,
+            "database": DEFAULT_DB_ALIAS,
+            "resume": True,
+        }
+
+        with (
+            patch.object(
+                Command, "add_temp_primary_key", side_effect=Exception("Oh no")
+            ),
+            self.assertRaises(Exception),
+        ):
+            cmd.handle(**opts, unlogged_load=True)
+        self.assertEqual("u", self.get_relpersistence(cmd.temp_table_name))
+
+        # the unlogged temp table is still set to logged before the swap
+        cmd = Command()
+        cmd.stdout = StringIO()
+        cmd.handle(**opts)
+
+        self.assertEqual(4, Address.objects.count())
+        self.assertEqual("p", self.get_relpersistence(Address._meta.db_table))
@@ -1,5 +1,8 @@
 import os
+import tempfile
+import zipfile
 from io import StringIO
+from pathlib import Path
 
 from django.contrib.gis.geos import Point
 from django.core.management import CommandError, call_command
@@ -46,6 +49,25 @@ class OnspdImportTest(TestCase):
         im11aa = Onspd.objects.filter(pcds="IM1 1AA")[0]
         self.assertIsNone(im11aa.location)
 
+    def test_import_onspd_stream(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            zip_path = Path(tmpdir) / "onspd.zip"
+            with zipfile.ZipFile(zip_path, "w") as zip_file:
+                for csv_file in Path(self.csv_path).glob("*.csv"):
+                    zip_file.write(csv_file, f"Data/{csv_file.name}")
+
+            opts = {
+                "url": zip_path.as_uri(),
+                "stream": True,
+                "database": DEFAULT_DB_ALIAS,
+            }
+            self.cmd.handle(**opts)
+
+        # the csv files were read from the zip, not extracted to disk
+        self.assertIsNone(self.cmd.tempdir)
+        self.assertEqual(4, Onspd.objects.count())
+        self.assertIsNone(Onspd.objects.get(pcds="IM1 1AA").location)
+
     def test_import_onspd_header_mismatch(self):
         # path to file with old header format
         old_header_path = os.path.abspath(
@@ -81,6 +103,91 @@ class OnspdImportTest(TestCase):
             self.cmd.handle(**opts)
 
 
+class DeltaOnspdImportTest(TestCase):
+    def setUp(self):
+        # start with a full import of the previous release
+        self.cmd = Command()
+        self.cmd.stdout = StringIO()
+        self.cmd.handle(
+            data_path=os.path.abspath(
+                os.path.join(
+                    os.path.dirname(os.path.abspath(__file__)),
+                    "../fixtures/onspd_nov2025",
+                )
+            ),
+            database=DEFAULT_DB_ALIAS,
+        )
+        # AB1 0AB was still live in the previous release
+        Onspd.objects.filter(pcds="AB1 0AB").update(doterm="")
+
+        self.delta_path = os.path.abspath(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "../fixtures/onspd_nov2025_delta",
+            )
+        )
+
+    def test_import_onspd_delta(self):
+        cmd = Command()
+        cmd.stdout = StringIO()
+        opts = {
+            "data_path": self.delta_path,
+            "database": DEFAULT_DB_ALIAS,
+            "delta": True,
+        }
+        cmd.handle(**opts)
+
+        self.assertEqual(
+            {
+                "inserted": 1,
+                "changed": 2,
+                "terminated": 1,
+                "removed": 1,
+                "columns": {"doterm": 1, "lad25cd": 1, "lat": 1},
+            },
+            cmd.delta_counts,
+        )
+
+        self.assertEqual(
+            ["AB1 0AA", "AB1 0AB", "AB1 0AE", "IM1 1AA"],
+            list(Onspd.objects.order_by("pcds").values_list("pcds", flat=True)),
+        )
+        ab10aa = Onspd.objects.get(pcds="AB1 0AA")
+        self.assertEqual("S12000034", ab10aa.lad25cd)
+        self.assertEqual(Point(-2.242858, 57.10146, srid=4326), ab10aa.location)
+        self.assertEqual("199606", Onspd.objects.get(pcds="AB1 0AB").doterm)
+        self.assertIsNotNone(Onspd.objects.get(pcds="AB1 0AE").location)
+        self.assertIsNone(Onspd.objects.get(pcds="IM1 1AA").location)
+
+    def test_import_onspd_delta_no_changes(self):
+        Onspd.objects.filter(pcds="AB1 0AB").update(doterm="199606")
+        cmd = Command()
+        cmd.stdout = StringIO()
+        opts = {
+            "data_path": os.path.abspath(
+                os.path.join(
+                    os.path.dirname(os.path.abspath(__file__)),
+                    "../fixtures/onspd_nov2025",
+                )
+            ),
+            "database": DEFAULT_DB_ALIAS,
+            "delta": True,
+        }
+        cmd.handle(**opts)
+
+        self.assertEqual(
+            {
+                "inserted": 0,
+                "changed": 0,
+                "terminated": 0,
+                "removed": 0,
+                "columns": {},
+            },
+            cmd.delta_counts,
+        )
+        self.assertEqual(4, Onspd.objects.count())
+
+
 class MultiDBOnspdImportTest(TransactionTestCase):
     databases = [DEFAULT_DB_ALIAS, "other"]
 
@@ -133,3 +240,32 @@ class MultiDBOnspdImportTest(TransactionTestCase):
             str(context.exception),
             "The connection 'nonexistent_db' doesn't exist.",
         )
+
+
+class ParallelOnspdImportTest(TransactionTestCase):
+    # Each worker COPYs over its own connection, so the temp table has to be
+    # committed before the workers can see it.
+    def setUp(self):
+        self.csv_path = os.path.abspath(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "../fixtures/onspd_nov2025_regions",
+            )
+        )
+        self.cmd = Command()
+        self.cmd.stdout = StringIO()  # suppress output
+
+    def test_import_onspd_parallel(self):
+        opts = {
+            "data_path": self.csv_path,
+            "database": DEFAULT_DB_ALIAS,
+            "parallel": 2,
+        }
+        self.cmd.handle(**opts)
+
+        self.assertEqual(4, Onspd.objects.count())
+        ab10aa = Onspd.objects.get(pcds="AB1 0AA")
+        self.assertEqual(
+            Point(-2.242858, 57.101459, srid=4326), ab10aa.location
+        )
+        self.assertIsNone(Onspd.objects.get(pcds="IM1 1AA").location)
@@ -1,7 +1,10 @@
 import os
 from io import StringIO
 
-from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.test import TestCase, TransactionTestCase
 
 from uk_geo_utils.management.commands.import_onsud import Command
 from uk_geo_utils.models import Onsud
@@ -25,12 +28,49 @@ class OnsudImportTest(TestCase):
         cmd.stdout = StringIO()
 
         # import data
-        opts = {"path": csv_path, "transaction": False}
+        opts = {"data_path": csv_path, "database": DEFAULT_DB_ALIAS}
         cmd.handle(**opts)
 
         # ensure all our tasty data has been imported
         self.assertEqual(4, Onsud.objects.count())
 
+    def test_import_onsud_deprecated_arguments(self):
+        csv_path = os.path.abspath(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), "../fixtures/onsud"
+            )
+        )
+
+        stdout = StringIO()
+        call_command("import_onsud", csv_path, "-t", stdout=stdout)
+
+        self.assertEqual(4, Onsud.objects.count())
+        self.assertIn("use --data-path instead", stdout.getvalue())
+        self.assertIn("--transaction is deprecated", stdout.getvalue())
+
+    def test_import_onsud_path_and_data_path(self):
+        with self.assertRaises(CommandError):
+            call_command(
+                "import_onsud", "/some/path", "--data-path", "/some/path"
+            )
+
+    def test_import_onsud_replaces_existing_data(self):
+        Onsud.objects.create(uprn="123")
+
+        csv_path = os.path.abspath(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), "../fixtures/onsud"
+            )
+        )
+
+        cmd = Command()
+        cmd.stdout = StringIO()
+        opts = {"data_path": csv_path, "database": DEFAULT_DB_ALIAS}
+        cmd.handle(**opts)
+
+        self.assertEqual(4, Onsud.objects.count())
+        self.assertFalse(Onsud.objects.filter(uprn="123").exists())
+
     def test_import_onsud_file_not_found(self):
         csv_path = os.path.abspath(
             os.path.join(
@@ -44,6 +84,29 @@ class OnsudImportTest(TestCase):
         # supress output
         cmd.stdout = StringIO()
 
-        opts = {"path": csv_path, "transaction": False}
+        opts = {"data_path": csv_path, "database": DEFAULT_DB_ALIAS}
         with self.assertRaises(FileNotFoundError):
             cmd.handle(**opts)
+
+
+class ParallelOnsudImportTest(TransactionTestCase):
+    # Each worker COPYs over its own connection, so the temp table has to be
+    # committed before the workers can see it.
+    def test_import_onsud_parallel(self):
+        csv_path = os.path.abspath(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "../fixtures/onsud_regions",
+            )
+        )
+
+        cmd = Command()
+        cmd.stdout = StringIO()
+        opts = {
+            "data_path": csv_path,
+            "database": DEFAULT_DB_ALIAS,
+            "parallel": 2,
+        }
+        cmd.handle(**opts)
+
+        self.assertEqual(4, Onsud.objects.count())
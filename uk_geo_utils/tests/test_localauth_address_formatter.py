@@ -1,6 +1,9 @@
 from django.test import TestCase
 
-from uk_geo_utils.helpers import LocalAuthAddressFormatter
+from uk_geo_utils.helpers import (
+    LocalAuthAddressFormatter,
+    format_local_auth_label,
+)
 
 
 class LocalAuthAddressFormatterTest(TestCase):
@@ -112,3 +115,57 @@ class LocalAuthAddressFormatterTest(TestCase):
             "FLAT 1 4A WARWICK ROAD, COTHAM, BRISTOL",
             af.generate_address_label(),
         )
+
+
+class FormatLocalAuthLabelTest(TestCase):
+    def test_format_local_auth_label(self):
+        self.assertEqual(
+            "TESCO STORES LTD, 138-142 CHELTENHAM ROAD, MONTPELIER, BRISTOL",
+            format_local_auth_label(
+                (
+                    "TESCO STORES LTD",
+                    *("", "", "", "", ""),
+                    *("138", "", "142", "", ""),
+                    "CHELTENHAM ROAD",
+                    "MONTPELIER",
+                    "BRISTOL",
+                )
+            ),
+        )
+
+    def test_sao_and_pao_ranges(self):
+        fields = (
+            "",
+            *("1", "A", "3", "B", "FLAT"),
+            *("", "C", "", "D", "ROSE COTTAGE"),
+            "HIGH STREET",
+            "",
+            "HORLEY",
+        )
+        self.assertEqual(
+            "FLAT 1A-3B ROSE COTTAGE C D HIGH STREET, HORLEY",
+            format_local_auth_label(fields),
+        )
+        self.assertEqual(
+            format_local_auth_label(fields),
+            LocalAuthAddressFormatter(*fields).generate_address_label(),
+        )
+
+    def test_empty_suffixes_can_be_none(self):
+        af = LocalAuthAddressFormatter(
+            organisation_name="",
+            sao_start_number="",
+            sao_start_suffix=None,
+            sao_end_number="",
+            sao_end_suffix=None,
+            sao_text="",
+            pao_start_number="1",
+            pao_start_suffix=None,
+            pao_end_number="3",
+            pao_end_suffix=None,
+            pao_text="",
+            street_description="HIGH ST",
+            locality="",
+            town_name="X",
+        )
+        self.assertEqual("1-3 HIGH ST, X", af.generate_address_label())
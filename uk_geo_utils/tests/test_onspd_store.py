@@ -0,0 +1,208 @@
+import csv
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.gis.geos import Point
+from django.core.management import call_command
+from django.test import TestCase
+
+from uk_geo_utils.geocoders import (
+    OnspdGeocoder,
+    OnspdNotImportedException,
+    OnspdStoreGeocoder,
+)
+from uk_geo_utils.models import Onspd
+from uk_geo_utils.onspd_store import OnspdIndex, OnspdStore
+
+
+class OnspdStoreTest(TestCase):
+    def setUp(self):
+        Onspd.objects.create(
+            pcds="SA8 4DA",
+            lat="51.705345",
+            long="-3.852213",
+            lad25cd="W06000012",
+            ctry25cd="W92000004",
+        )
+        Onspd.objects.create(
+            pcds="SA8 4DB",
+            lat="51.705",
+            long="-3.85",
+            lad25cd="W06000012",
+            ctry25cd="W92000004",
+        )
+        Onspd.objects.create(
+            pcds="IM1 1AA",
+            lat="99.999999",
+            long="0.000000",
+            lad25cd="M99999999",
+            ctry25cd="M83000003",
+        )
+        # terminated postcodes aren't included
+        Onspd.objects.create(
+            pcds="SA8 4DC", doterm="199606", lat="51.7", long="-3.8"
+        )
+
+    def test_from_db(self):
+        store = OnspdStore.from_db()
+
+        self.assertEqual(3, len(store))
+        self.assertIn("SA8 4DA", store)
+        self.assertNotIn("SA8 4DC", store)
+
+        row = store.get_row("SA8 4DA")
+        self.assertEqual(
+            Point(-3.852213, 51.705345, srid=4326), store.get_centroid(row)
+        )
+        self.assertEqual("W06000012", store.get_code(row, "lad25cd"))
+        self.assertEqual("W92000004", store.get_code(row, "ctry25cd"))
+        self.assertIsNone(store.get_centroid(store.get_row("IM1 1AA")))
+
+    def test_codes_are_shared(self):
+        store = OnspdStore.from_db(columns=["lad25cd"])
+        self.assertEqual(["W06000012", "M99999999"], store._values["lad25cd"])
+
+    def test_aliases(self):
+        store = OnspdStore.from_db(columns=["lad25cd"])
+        row = store.get_row("SA8 4DA")
+        self.assertEqual("W06000012", store.get_code(row, "lad"))
+        with self.assertRaises(AttributeError):
+            # not stored
+            store.get_code(row, "ctry25cd")
+        with self.assertRaises(AttributeError):
+            store.get_code(row, "cty")
+
+    def test_from_csv(self):
+        fixture = os.path.abspath(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "../fixtures/onspd_nov2025/onspd_test.csv",
+            )
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # all of the fixture's postcodes have been terminated,
+            # so make AB1 0AA live again
+            path = os.path.join(tmpdir, "onspd.csv")
+            with open(fixture) as f, open(path, "w") as out:
+                reader = csv.DictReader(f)
+                writer = csv.DictWriter(out, fieldnames=reader.fieldnames)
+                writer.writeheader()
+                for row in reader:
+                    if row["pcds"] == "AB1 0AA":
+                        row["doterm"] = ""
+                    writer.writerow(row)
+
+            store = OnspdStore.from_csv([path])
+
+        self.assertEqual(1, len(store))
+        row = store.get_row("AB1 0AA")
+        self.assertEqual(
+            Point(-2.242858, 57.101459, srid=4326), store.get_centroid(row)
+        )
+        self.assertEqual("S12000033", store.get_code(row, "lad"))
+
+
+class OnspdStoreGeocoderTest(TestCase):
+    def setUp(self):
+        Onspd.objects.create(
+            pcds="SA8 4DA",
+            lat="51.705345",
+            long="-3.852213",
+            lad25cd="W06000012",
+            ctry25cd="W92000004",
+        )
+        self.store = OnspdStore.from_db()
+
+    def test_geocode(self):
+        with self.assertNumQueries(0):
+            g = OnspdStoreGeocoder("sa84da", self.store)
+            self.assertEqual(Point(-3.852213, 51.705345, srid=4326), g.centroid)
+            self.assertEqual("W06000012", g.get_code("lad"))
+            self.assertEqual("W92000004", g.get_code("ctry25cd"))
+
+    def test_invalid_postcode(self):
+        with self.assertRaises(Onspd.DoesNotExist):
+            OnspdStoreGeocoder("SA8 4DX", self.store)
+
+    def test_malformed_postcode(self):
+        # rejected before looking anything up
+        with self.assertNumQueries(0):
+            with self.assertRaises(Onspd.DoesNotExist):
+                OnspdStoreGeocoder("SA8 D4X", self.store)
+            with self.assertRaises(Onspd.DoesNotExist):
+                OnspdGeocoder("SA8 D4X")
+
+    def test_empty_store(self):
+        with self.assertRaises(OnspdNotImportedException):
+            OnspdStoreGeocoder("SA8 4DA", OnspdStore())
+
+
+class OnspdIndexTest(TestCase):
+    def setUp(self):
+        for pcds, lat, long, lad in [
+            ("SA8 4DA", "51.705345", "-3.852213", "W06000012"),
+            ("SA8 4DB", "51.705", "-3.85", "W06000012"),
+            ("SW1A 1AA", "51.501009", "-0.141588", "E09000033"),
+            ("IM1 1AA", "99.999999", "0.000000", "M99999999"),
+        ]:
+            Onspd.objects.create(pcds=pcds, lat=lat, long=long, lad25cd=lad)
+        Onspd.objects.create(
+            pcds="SA8 4DC", doterm="199606", lat="51.7", long="-3.8"
+        )
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "onspd.idx")
+        call_command(
+            "export_onspd_index",
+            self.path,
+            columns=["lad25cd", "ctry25cd"],
+            stdout=StringIO(),
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_lookup(self):
+        with OnspdIndex(self.path) as index:
+            self.assertEqual(4, len(index))
+            self.assertEqual(["lad25cd", "ctry25cd"], index.columns)
+            self.assertNotIn("SA8 4DC", index)
+            self.assertNotIn("ZZ9 9ZZ", index)
+
+            row = index.get_row("SW1A 1AA")
+            self.assertEqual(
+                Point(-0.141588, 51.501009, srid=4326), index.get_centroid(row)
+            )
+            self.assertEqual("E09000033", index.get_code(row, "lad"))
+            self.assertEqual("", index.get_code(row, "ctry25cd"))
+            self.assertIsNone(index.get_centroid(index.get_row("IM1 1AA")))
+
+            with self.assertRaises(Onspd.DoesNotExist):
+                index.get_row("SA8 4DC")
+
+    def test_geocoder(self):
+        with OnspdIndex(self.path) as index, self.assertNumQueries(0):
+            g = OnspdStoreGeocoder("sa84da", index)
+            self.assertEqual(Point(-3.852213, 51.705345, srid=4326), g.centroid)
+            self.assertEqual("W06000012", g.get_code("lad"))
+
+    def test_not_an_index(self):
+        path = os.path.join(self.tmpdir.name, "not_an_index")
+        with open(path, "wb") as f:
+            f.write(b"pcds,lat,long")
+        with self.assertRaises(ValueError):
+            OnspdIndex(path)
+
+    def test_write_checks_rows(self):
+        path = os.path.join(self.tmpdir.name, "bad.idx")
+        rows = [
+            {"pcds": "SA8 4DB", "lat": "51.7", "long": "-3.8", "lad25cd": "W1"},
+            {"pcds": "SA8 4DA", "lat": "51.7", "long": "-3.8", "lad25cd": "W1"},
+        ]
+        with self.assertRaisesMessage(ValueError, "out of order"):
+            OnspdIndex.write(path, rows, ["lad25cd"], [2])
+        with self.assertRaisesMessage(ValueError, "longer than its width"):
+            OnspdIndex.write(path, rows[1:], ["lad25cd"], [1])
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(f"{path}.tmp"))
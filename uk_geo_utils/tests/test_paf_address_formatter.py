@@ -1,6 +1,6 @@
 from django.test import TestCase
 
-from uk_geo_utils.helpers import PAFAddressFormatter
+from uk_geo_utils.helpers import PAFAddressFormatter, format_paf_label
 
 
 class PAFAddressFormatterTest(TestCase):
@@ -114,3 +114,67 @@ class PAFAddressFormatterTest(TestCase):
             "AKZO NOBEL CAR REFINISHES BV, PO Box 3986, SWINDON",
             af.generate_address_label(),
         )
+
+
+class FormatPafLabelTest(TestCase):
+    def test_format_paf_label(self):
+        self.assertEqual(
+            "2A MANOR ROAD, MILE OAK, TAMWORTH",
+            format_paf_label(
+                (
+                    "",
+                    "",
+                    "",
+                    "",
+                    "2A",
+                    "",
+                    "",
+                    "MANOR ROAD",
+                    "TAMWORTH",
+                    "",
+                    "MILE OAK",
+                )
+            ),
+        )
+
+    def test_single_letter_building_name(self):
+        self.assertEqual(
+            "A HIGH STREET, HORLEY",
+            format_paf_label(
+                ("", "", "", "", "A", "", "", "HIGH STREET", "HORLEY", "", "")
+            ),
+        )
+
+    def test_no_post_town(self):
+        self.assertEqual(
+            "33 BONEHURST ROAD",
+            format_paf_label(
+                ("", "", "", "", "", "33", "", "BONEHURST ROAD", "", "", "")
+            ),
+        )
+
+    def test_post_town_replaces_sixth_line(self):
+        # the post town always goes on the 6th line of the label, so if the
+        # label is already that long, the 6th line is replaced
+        fields = (
+            "ACME LTD",
+            "SALES",
+            "123",
+            "FLAT 1",
+            "ROSE COTTAGE",
+            "",
+            "MILL LANE",
+            "HIGH STREET",
+            "HORLEY",
+            "LITTLE HAMLET",
+            "MILE OAK",
+        )
+        self.assertEqual(
+            "ACME LTD, SALES, PO Box 123, FLAT 1, ROSE COTTAGE, HORLEY, "
+            "HIGH STREET, LITTLE HAMLET, MILE OAK",
+            format_paf_label(fields),
+        )
+        self.assertEqual(
+            format_paf_label(fields),
+            PAFAddressFormatter(*fields).generate_address_label(),
+        )
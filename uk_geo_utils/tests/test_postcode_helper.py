@@ -1,7 +1,13 @@
 # -*- coding: utf-8 -*-
 from django.test import TestCase
 
-from uk_geo_utils.helpers import Postcode
+from uk_geo_utils import helpers
+from uk_geo_utils.helpers import (
+    NormalisedPostcode,
+    Postcode,
+    normalise_postcodes,
+    validate_postcodes,
+)
 
 
 class PostcodeHelperTest(TestCase):
@@ -64,6 +70,40 @@ class PostcodeHelperTest(TestCase):
         with self.assertRaises(ValueError):
             Postcode("abc", validate=True)
 
+    def test_create_invalid_strict(self):
+        self.assertEqual("SW1A1AA", str(Postcode("sw1a 1aa", strict=True)))
+        for postcode in ["abcde", "SW1A 1A1", "1AA 1AA", "SW1AA 1AA"]:
+            with self.assertRaises(ValueError):
+                Postcode(postcode, strict=True)
+
+    def test_is_valid(self):
+        for postcode in [
+            "M1 1AE",
+            "B33 8TH",
+            "CR2 6XH",
+            "DN55 1PT",
+            "W1A 0AX",
+            "EC1A 1BB",
+            "GIR 0AA",
+            "BFPO 801",
+            "BFPO 1",
+            "STHL 1ZZ",
+        ]:
+            self.assertTrue(Postcode(postcode).is_valid, postcode)
+        for postcode in [
+            "",
+            "foo",
+            "M1 1A",
+            "M1 AAE",
+            "MMM1 1AE",
+            "M111 1AE",
+            "1M 1AE",
+            "GIR 0AB",
+            "BFPO",
+            "BFPO 12345",
+        ]:
+            self.assertFalse(Postcode(postcode).is_valid, postcode)
+
     def test_with_space_less_than_three_chars(self):
         # these aren't necessarily terribly useful outputs but these tests
         # demonstrate that with_space() does not raise in the situation
@@ -84,3 +124,95 @@ class PostcodeHelperTest(TestCase):
 
     def test_equality_different_type(self):
         self.assertNotEqual("AA1 1AA", Postcode("AA1 1AA"))
+
+    def test_territory(self):
+        self.assertEqual("NI", Postcode("bt1 1aa").territory)
+        self.assertEqual("GB", Postcode("SW1A 1AA").territory)
+
+    def test_normalise(self):
+        for postcode in self.postcodes:
+            self.assertEqual(
+                postcode["exp_no_space"], Postcode.normalise(postcode["input"])
+            )
+        self.assertEqual("AA11AA", Postcode.normalise(Postcode("AA1 1AA")))
+
+    def test_non_ascii_input(self):
+        # upper() turns some non-ASCII characters into ASCII ones
+        self.assertEqual("SS11AA", Postcode("ß1 1AA").without_space)
+        self.assertEqual("M11AA", Postcode("m1 1aa£").without_space)
+
+    def test_hash(self):
+        self.assertEqual(
+            {Postcode("AA1 1AA")}, {Postcode("aa11aa"), Postcode("AA1 1AA")}
+        )
+
+
+class BulkPostcodeHelperTest(TestCase):
+    def test_normalise_postcodes(self):
+        self.assertEqual(
+            [
+                NormalisedPostcode("SW1A", "1AA", "SW1A 1AA", "SW1A1AA", "GB"),
+                NormalisedPostcode("BT1", "5GS", "BT1 5GS", "BT15GS", "NI"),
+                NormalisedPostcode("M1", "1AE", "M1 1AE", "M11AE", "GB"),
+                NormalisedPostcode("", "AB", " AB", "AB", "GB"),
+            ],
+            list(
+                normalise_postcodes(
+                    ["sw1a 1aa", " BT1 5GS", Postcode("m11ae"), "ab"]
+                )
+            ),
+        )
+
+    def test_normalise_postcodes_validate(self):
+        self.assertEqual(
+            [None, "M1 1AE"],
+            [
+                p and p.with_space
+                for p in normalise_postcodes(["ab", "m1 1ae"], validate=True)
+            ],
+        )
+
+    def test_normalise_postcodes_strict(self):
+        self.assertEqual(
+            [None, "M1 1AE", None],
+            [
+                p and p.with_space
+                for p in normalise_postcodes(
+                    ["abcde", "m1 1ae", "m1 ae"], strict=True
+                )
+            ],
+        )
+
+    def test_matches_postcode(self):
+        inputs = [
+            postcode["input"] for postcode in PostcodeHelperTest.postcodes
+        ]
+        for parsed, postcode in zip(normalise_postcodes(inputs), inputs):
+            self.assertEqual(Postcode(postcode).with_space, parsed.with_space)
+            self.assertEqual(
+                Postcode(postcode).without_space, parsed.without_space
+            )
+
+    def test_validate_postcodes(self):
+        self.assertEqual(
+            [True, False, True],
+            list(validate_postcodes(["SW1A 1AA", "abc", "M1 1AE"])),
+        )
+
+    def test_validate_postcodes_strict(self):
+        self.assertEqual(
+            [True, False, True, False],
+            list(
+                validate_postcodes(
+                    ["SW1A 1AA", "abcde", "GIR 0AA", "SW1A 1A1"], strict=True
+                )
+            ),
+        )
+
+    def test_normalise_postcodes_leaves_postcode_cache(self):
+        # bulk runs of mostly distinct postcodes shouldn't flush the cache
+        # the geocoders' Postcode objects use
+        Postcode("SW1A 1AA")
+        cache = dict(helpers._postcode_cache)
+        list(normalise_postcodes(f"AB{i} 1AA" for i in range(10000)))
+        self.assertEqual(cache, helpers._postcode_cache)